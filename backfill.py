@@ -0,0 +1,239 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Description:
+# reloads a past time range of interface and slot metrics into Kafka, window
+# by window in time order, resuming where an interrupted run stopped
+#
+# usage: python backfill.py START END [--devices PATTERN ...] [--metrics PATTERN ...]
+#                           [--kinds interfaces slots] [--window s] [--parallel n] [--restart]
+#   START / END -> ISO 8601 (UTC when no offset is given) or epoch milliseconds
+
+import time
+import logging
+import argparse
+from fnmatch import fnmatch
+from collections import deque
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+from config import config
+from catalog import Metric_Catalog
+from collector import Metrics_Collector
+from inventory import Inventory_Cache
+from kafka_connector import Kafka_Connector
+from rate_limiter import AIMD_Limiter, Esight_Limiter
+from records import interface_messages, publish_records, slot_messages
+from state_files import load_json, save_json
+from watermarks import Watermark_Store
+from esight_connector import Esight_Connector
+
+def parse_time(value):
+    # epoch milliseconds or ISO 8601
+    if value.isdigit():
+        return int(value)
+
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+
+    return int(moment.timestamp()*1e3)
+
+def matches(patterns, *values):
+    return not patterns or any(fnmatch(str(value), pattern) for pattern in patterns for value in values)
+
+def select_tasks(grouped_tasks, devices, device_patterns, metric_patterns):
+    # grouped_tasks -> {interface or nedn: {task_id: Task}}, devices -> {nedn: name}
+    # a device pattern matches the nedn, the device name or the interface / slot name
+    selected = {}
+    for group, tasks in grouped_tasks.items():
+        kept = {
+            task_id: task for task_id, task in tasks.items()
+            if matches(device_patterns, task.resource.nedn, devices.get(task.resource.nedn, ""), task.resource.name)
+            and matches(metric_patterns, task.friendly_name)
+        }
+        if kept:
+            selected[group] = kept
+
+    return selected
+
+def publish(kafka_producer, interfaces_tasks, slots_tasks, metrics):
+    # same messages main.py sends, so consumers cannot tell a backfill apart
+    sent = 0
+
+    if config.OUTPUT_MODE == "records":
+        for topic, grouped_tasks in ((config.KAFKA_INTERFACE_RECORDS_TOPIC, interfaces_tasks), (config.KAFKA_SLOT_RECORDS_TOPIC, slots_tasks)):
+            for tasks in grouped_tasks.values():
+                for task_id, task in tasks.items():
+                    if task_id in metrics:
+                        sent += publish_records(kafka_producer, topic, task.resource.nedn, task.resource.name, task.friendly_name, metrics[task_id])
+        return sent
+
+    for msg in interface_messages(interfaces_tasks, metrics):
+        kafka_producer.send_message('esight_interface', msg)
+        sent += 1
+
+    for msg in slot_messages(slots_tasks, metrics):
+        kafka_producer.send_message('esight_slot', msg)
+        sent += 1
+
+    return sent
+
+def fetch_window(collector, tasks, start, end, attempts):
+    # a window only counts when every task got its metrics, the collector
+    # leaves out the failed ones so they are asked again here
+    metrics = {}
+    missing = dict(tasks)
+    for attempt in range(attempts):
+        metrics.update(collector.collect(missing, start, end))
+        missing = {task_id: task for task_id, task in missing.items() if task_id not in metrics}
+        if not missing:
+            return metrics
+
+        logging.warning(f"backfill: {len(missing)} tasks failed in [{start}, {end}], attempt {attempt + 1}/{attempts}")
+
+    raise RuntimeError(f"{len(missing)} tasks could not be fetched in [{start}, {end}]")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="reload a past time range of eSight metrics into Kafka")
+    parser.add_argument("start", type=parse_time, help="ISO 8601 (UTC by default) or epoch milliseconds")
+    parser.add_argument("end", type=parse_time, help="ISO 8601 (UTC by default) or epoch milliseconds")
+    parser.add_argument("--devices", nargs="+", default=[], help="nedn, device, interface or slot name patterns (fnmatch)")
+    parser.add_argument("--metrics", nargs="+", default=[], help="metric patterns, e.g. sending_rate or *_usage")
+    parser.add_argument("--kinds", nargs="+", choices=("interfaces", "slots"), default=["interfaces", "slots"])
+    parser.add_argument("--window", type=int, default=config.COLLECTOR_MAX_WINDOW, help="seconds asked to eSight per request")
+    parser.add_argument("--parallel", type=int, default=config.BACKFILL_PARALLEL_WINDOWS, help="windows fetched at the same time")
+    parser.add_argument("--attempts", type=int, default=3, help="tries per window before giving up")
+    parser.add_argument("--state", default=config.BACKFILL_STATE_PATH, help="progress file, rerun with the same arguments to resume")
+    parser.add_argument("--restart", action="store_true", help="ignore the progress of a previous run")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='[%(levelname)s] - %(asctime)s -> %(message)s', level=logging.INFO, datefmt='%d-%m-%Y %H:%M:%S')
+
+    if args.end <= args.start:
+        parser.error("end must be after start")
+
+    esight = Esight_Connector(
+        config.ESIGHT_LOCATION,
+        config.ESIGHT_USERNAME,
+        config.ESIGHT_PASSWORD,
+        pool_connections=config.ESIGHT_POOL_CONNECTIONS,
+        pool_maxsize=config.ESIGHT_POOL_MAXSIZE,
+        token_lifetime=config.ESIGHT_TOKEN_LIFETIME,
+        refresh_margin=config.ESIGHT_TOKEN_REFRESH_MARGIN,
+        batch_size=config.ESIGHT_BATCH_SIZE,
+        limiter=Esight_Limiter(
+            rate=config.ESIGHT_RATE_LIMIT,
+            burst=config.ESIGHT_RATE_BURST,
+            concurrency=AIMD_Limiter(
+                initial=config.ESIGHT_CONCURRENCY_INITIAL,
+                min_limit=config.ESIGHT_CONCURRENCY_MIN,
+                max_limit=config.ESIGHT_CONCURRENCY_MAX,
+                latency_target=config.ESIGHT_LATENCY_TARGET
+            )
+        ),
+        retries=config.ESIGHT_RETRIES,
+        backoff=config.ESIGHT_BACKOFF,
+        backoff_max=config.ESIGHT_BACKOFF_MAX
+    )
+
+    # --- TASKS ---
+    # history is asked per resource and indicator, whatever tasks exist on eSight now
+    catalog = Metric_Catalog.load(config.METRIC_CATALOG_PATH)
+    inventory = Inventory_Cache(esight, config.INVENTORY_PATH, slot_categories=catalog.device_categories)
+    if not inventory.load():
+        inventory.refresh()
+
+    _, interfaces_tasks, slots_tasks = catalog.build_tasks(inventory.interfaces, inventory.devices, inventory.slots)
+    devices = {device["nedn"]: device.get("name", "") for device in inventory.devices}
+
+    interfaces_tasks = select_tasks(interfaces_tasks, devices, args.devices, args.metrics) if "interfaces" in args.kinds else {}
+    slots_tasks = select_tasks(slots_tasks, devices, args.devices, args.metrics) if "slots" in args.kinds else {}
+    tasks = {task_id: task for grouped_tasks in (interfaces_tasks, slots_tasks) for group in grouped_tasks.values() for task_id, task in group.items()}
+
+    if not tasks:
+        logging.error("backfill: nothing matches the given devices and metrics")
+        raise SystemExit(1)
+
+    # --- PROGRESS ---
+    # a previous run of the very same backfill resumes after its last published window
+    job = {
+        "start": args.start,
+        "end": args.end,
+        "window": args.window,
+        "devices": args.devices,
+        "metrics": args.metrics,
+        "kinds": sorted(args.kinds)
+    }
+    state = load_json(args.state, {})
+    done_until = args.start
+    if not args.restart and state.get("job") == job:
+        done_until = state.get("done_until", args.start)
+        logging.info(f"backfill: resuming from {datetime.fromtimestamp(done_until / 1e3, timezone.utc).isoformat()}")
+
+    windows = Watermark_Store.split_window(done_until, args.end, args.window * 1000)
+    total_windows = len(Watermark_Store.split_window(args.start, args.end, args.window * 1000))
+    logging.info(f"backfill: {len(tasks)} tasks, {len(windows)} of {total_windows} windows to go")
+
+    kafka_producer = Kafka_Connector(
+        discovery_url=config.KAFKA_LOCATION,
+        linger_ms=config.KAFKA_LINGER_MS,
+        batch_size=config.KAFKA_BATCH_SIZE,
+        compression_type=config.KAFKA_COMPRESSION or None,
+        acks=config.KAFKA_ACKS if config.KAFKA_ACKS == "all" else int(config.KAFKA_ACKS),
+        max_in_flight=config.KAFKA_MAX_IN_FLIGHT,
+        serializer=config.KAFKA_SERIALIZER
+    )
+
+    # batches of a window run on the collector workers, up to args.parallel windows
+    # are fetched ahead, and they are published strictly in time order
+    collector = Metrics_Collector(esight, concurrency=config.COLLECTOR_CONCURRENCY, max_window=args.window * 1000)
+    windows_executor = ThreadPoolExecutor(max_workers=args.parallel, thread_name_prefix="backfill")
+
+    backfill_start = time.monotonic()
+    published = 0
+    pending = deque()
+    remaining = iter(windows)
+
+    def submit_next():
+        window = next(remaining, None)
+        if window is not None:
+            pending.append((window, windows_executor.submit(fetch_window, collector, tasks, window[0], window[1], args.attempts)))
+
+    for _ in range(args.parallel):
+        submit_next()
+
+    try:
+        done = total_windows - len(windows)
+        while pending:
+            (window_start, window_end), future = pending.popleft()
+            metrics = future.result()
+            submit_next()
+
+            failed = kafka_producer.stats["failed"]
+            published += publish(kafka_producer, interfaces_tasks, slots_tasks, metrics)
+
+            # only acknowledged messages count as done, a crash repeats at most one window
+            kafka_producer.flush()
+            if kafka_producer.stats["failed"] > failed:
+                raise RuntimeError(f"Kafka did not take every message of [{window_start}, {window_end}], rerun to resume from it")
+
+            save_json(args.state, {"job": job, "done_until": window_end})
+            done += 1
+
+            elapsed = time.monotonic() - backfill_start
+            windows_left = total_windows - done
+            rate = (done - (total_windows - len(windows))) / elapsed if elapsed else 0
+            logging.info(
+                f"backfill: {done}/{total_windows} windows ({done / total_windows:.0%}), "
+                f"up to {datetime.fromtimestamp(window_end / 1e3, timezone.utc).isoformat()}, "
+                f"{published} messages, ETA {windows_left / rate if rate else 0:.0f}s"
+            )
+
+    finally:
+        windows_executor.shutdown(wait=False, cancel_futures=True)
+        collector.shutdown()
+        kafka_producer.close_producer()
+        esight.close()
+
+    logging.info(f"backfill: done, {published} messages in {time.monotonic() - backfill_start:.1f}s")
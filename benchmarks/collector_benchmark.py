@@ -0,0 +1,212 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Description:
+# end-to-end benchmark of startup (login, inventory, provisioning) and polling
+# cycles against the local eSight and Kafka stand-ins, each size runs in its
+# own process so CPU and peak memory are not mixed between sizes
+#
+# usage: python benchmarks/collector_benchmark.py [--tasks 1000 10000 100000] [--cycles 3]
+#                                                 [--latency s] [--error-rate r] [--window minutes]
+
+import os
+import ssl
+import sys
+import json
+import time
+import logging
+import argparse
+import resource
+import tempfile
+import warnings
+import subprocess
+import urllib.request
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+
+import kafka_connector
+from fake_kafka import Fake_Producer
+from metrics import Metrics_Registry
+from records import interface_messages, slot_messages
+
+def start_fake_esight(args):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BENCHMARKS, "fake_esight.py"), "--tasks", str(args.run), "--latency", str(args.latency), "--error-rate", str(args.error_rate)],
+        stdout=subprocess.PIPE,
+        text=True
+    )
+    port = int(process.stdout.readline())
+    return process, port
+
+def esight_requests(port):
+    context = ssl._create_unverified_context()
+    with urllib.request.urlopen(f"https://127.0.0.1:{port}/_stats", context=context) as response:
+        return sum(json.loads(response.read()).values())
+
+def usage():
+    # CPU seconds of this process, peak resident memory in MB (ru_maxrss is in KB on Linux)
+    rusage = resource.getrusage(resource.RUSAGE_SELF)
+    return rusage.ru_utime + rusage.ru_stime, rusage.ru_maxrss / 1024
+
+class Phase:
+
+    def __init__(self, port):
+        self.port = port
+
+    def __enter__(self):
+        self.requests = esight_requests(self.port)
+        self.cpu, _ = usage()
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.duration = time.perf_counter() - self.started_at
+        cpu, self.peak_memory = usage()
+        self.cpu = cpu - self.cpu
+        self.requests = esight_requests(self.port) - self.requests
+
+    def result(self):
+        return {
+            "duration": self.duration,
+            "requests": self.requests,
+            "requests_per_second": self.requests / self.duration if self.duration else 0,
+            "cpu": self.cpu,
+            "peak_memory": self.peak_memory
+        }
+
+def publish(kafka_producer, interfaces_tasks, slots_tasks, metrics):
+    # nested messages, as main.py sends them
+    for msg in interface_messages(interfaces_tasks, metrics):
+        kafka_producer.send_message('esight_interface', msg)
+
+    for msg in slot_messages(slots_tasks, metrics):
+        kafka_producer.send_message('esight_slot', msg)
+
+    kafka_producer.flush()
+
+def run(args):
+    from catalog import Metric_Catalog
+    from collector import Metrics_Collector
+    from inventory import Inventory_Cache
+    from provisioner import Task_Provisioner
+    from watermarks import Watermark_Store
+    from esight_connector import Esight_Connector
+    from main import build_metrics_tasks
+
+    kafka_connector.KafkaProducer = Fake_Producer
+    fake_esight, port = start_fake_esight(args)
+    state = tempfile.mkdtemp(prefix="collector-benchmark-")
+    results = {"tasks": args.run}
+
+    try:
+        with Phase(port) as startup:
+            esight = Esight_Connector(f"127.0.0.1:{port}", "benchmark", "benchmark", batch_size=args.batch_size)
+            catalog = Metric_Catalog.load(os.path.join(os.path.dirname(BENCHMARKS), "metric_catalog.json"))
+
+            inventory = Inventory_Cache(esight, os.path.join(state, "inventory.json"), slot_categories=catalog.device_categories)
+            inventory.refresh()
+
+            task_specs, interfaces_tasks, slots_tasks = catalog.build_tasks(inventory.interfaces, inventory.devices, inventory.slots)
+            provisioned = Task_Provisioner(esight, args.concurrency).provision(task_specs)
+            interfaces_metrics_tasks, slots_metrics_tasks = build_metrics_tasks(interfaces_tasks, slots_tasks, provisioned)
+
+        results["startup"] = startup.result()
+        results["provisioned"] = len(provisioned)
+
+        registry = Metrics_Registry()
+        kafka_producer = kafka_connector.Kafka_Connector(address="in-process", metrics=registry)
+        collector = Metrics_Collector(
+            esight,
+            concurrency=args.concurrency,
+            watermarks=Watermark_Store(os.path.join(state, "watermarks.json"))
+        )
+
+        tasks = {**interfaces_metrics_tasks, **slots_metrics_tasks}
+        end = int(time.time()*1e3)
+        cycles = []
+        for cycle in range(args.cycles):
+            start, end = end, end + args.window*60*1000
+            if cycle == 0:
+                start = end - args.window*60*1000
+
+            with Phase(port) as polling:
+                metrics = collector.collect(tasks, start, end)
+                publish(kafka_producer, interfaces_tasks, slots_tasks, metrics)
+
+            cycles.append(dict(polling.result(), collected=len(metrics)))
+
+        results["cycles"] = cycles
+
+        # every acked message has to be timed, or the Kafka latency histogram is lying
+        acked = sum(sample[2] for sample in registry.families["kafka_send_duration_seconds"]["samples"].values())
+        if acked != kafka_producer.stats["delivered"]:
+            raise RuntimeError(f"kafka_send_duration_seconds has {acked} samples for {kafka_producer.stats['delivered']} acked messages")
+        collector.shutdown()
+        esight.close()
+
+    finally:
+        fake_esight.terminate()
+        fake_esight.wait()
+
+    print(json.dumps(results), flush=True)
+
+def report(results):
+    print(f"{'tasks':>8}  {'phase':<9}{'time (s)':>10}{'requests':>10}{'req/s':>9}{'cpu (s)':>9}{'peak MB':>9}{'collected':>11}")
+    for result in results:
+        phases = [("startup", result["startup"])] + [(f"cycle {i + 1}", cycle) for i, cycle in enumerate(result["cycles"])]
+        for name, phase in phases:
+            print(
+                f"{result['tasks']:>8}  {name:<9}{phase['duration']:>10.2f}{phase['requests']:>10}{phase['requests_per_second']:>9.0f}"
+                f"{phase['cpu']:>9.2f}{phase['peak_memory']:>9.0f}{phase.get('collected', result['provisioned']):>11}"
+            )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="collector benchmark against local eSight and Kafka stand-ins")
+    parser.add_argument("--tasks", type=int, nargs="+", default=[1000, 10000, 100000], help="inventory sizes, in tasks")
+    parser.add_argument("--cycles", type=int, default=3, help="polling cycles per size")
+    parser.add_argument("--window", type=int, default=15, help="minutes collected per cycle")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the fake eSight adds to every answer")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of the requests the fake eSight answers with a 503")
+    parser.add_argument("--concurrency", type=int, default=8, help="collector and provisioning workers")
+    parser.add_argument("--batch-size", type=int, default=100, help="series per historyByIndexKeys request")
+    parser.add_argument("--timeout", type=int, default=3600, help="seconds a size may run before it is reported as failed")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--run", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # before the modules configure it, per-request INFO lines would dominate the timings
+    logging.basicConfig(format='[%(levelname)s] - %(asctime)s -> %(message)s', level=args.log_level, datefmt='%d-%m-%Y %H:%M:%S')
+    warnings.filterwarnings("ignore", message="Unverified HTTPS request")
+
+    if args.run:
+        run(args)
+        sys.exit(0)
+
+    results = []
+    for tasks in args.tasks:
+        try:
+            child = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run", str(tasks)] + [
+                    option for name, value in (
+                        ("--cycles", args.cycles), ("--window", args.window), ("--latency", args.latency),
+                        ("--error-rate", args.error_rate), ("--concurrency", args.concurrency),
+                        ("--batch-size", args.batch_size), ("--log-level", args.log_level)
+                    )
+                    for option in (name, str(value))
+                ],
+                stdout=subprocess.PIPE,
+                text=True,
+                timeout=args.timeout
+            )
+        except subprocess.TimeoutExpired:
+            print(f"{tasks} tasks: benchmark timed out after {args.timeout}s", file=sys.stderr)
+            continue
+
+        if child.returncode != 0:
+            print(f"{tasks} tasks: benchmark failed", file=sys.stderr)
+            continue
+
+        results.append(json.loads(child.stdout.strip().splitlines()[-1]))
+
+    report(results)
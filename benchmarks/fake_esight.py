@@ -0,0 +1,216 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Description:
+# local HTTPS stand-in for eSight, serving a synthetic inventory sized by the
+# number of tasks it should produce, with injected latency and errors
+#
+# usage: python benchmarks/fake_esight.py [--tasks N] [--port P] [--latency s] [--error-rate r]
+
+import os
+import sys
+import ssl
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from urllib.parse import urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from devices import Device, Slot
+from samples import history_entry
+
+PORTS_PER_DEVICE = 48
+
+def build_inventory(tasks):
+    # 80% of the tasks on interfaces (2 per interface), 20% on routers
+    # (4 IPU boards with 2 metrics each, 1 fan and 1 power supply: 10 per router)
+    interfaces_count = max(tasks * 4 // 10, 1)
+    routers_count = max(tasks // 50, 1)
+
+    interfaces = [
+        {
+            "name": f"GigabitEthernet{index // PORTS_PER_DEVICE}/0/{index % PORTS_PER_DEVICE}",
+            "nedn": f"NE={100000 + index // PORTS_PER_DEVICE}",
+            "operstatus": 1
+        }
+        for index in range(interfaces_count)
+    ]
+
+    devices = []
+    slots = {}
+    for index in range(routers_count):
+        nedn = f"NE={900000 + index}"
+        devices.append({"nedn": nedn, "name": f"router-{index}", "necategory": Device.ROUTER.value})
+
+        slots[nedn] = [
+            {"nedn": nedn, "slotname": f"IPU {slot}", "physicalclass": Slot.BOARD.value, "operstatus": 3, "serialnum": f"SN{index:06d}B{slot}"}
+            for slot in range(4)
+        ] + [
+            {"nedn": nedn, "slotname": "FAN 1", "physicalclass": Slot.FAN.value, "operstatus": 3, "serialnum": f"SN{index:06d}F1"},
+            {"nedn": nedn, "slotname": "PWR 1", "physicalclass": Slot.POWER.value, "operstatus": 3, "serialnum": f"SN{index:06d}P1"}
+        ]
+
+    return interfaces, devices, slots
+
+def self_signed_certificate(directory):
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-keyout", key, "-out", cert, "-days", "1", "-subj", "/CN=localhost"],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    return cert, key
+
+class Fake_Esight:
+
+    success = "Operation success."
+
+    def __init__(self, tasks=1000, latency=0.0, error_rate=0.0, period=5*60*1000):
+        # latency -> seconds added to every answer
+        # error_rate -> share of the requests answered with a 503
+        self.interfaces, self.devices, self.slots = build_inventory(tasks)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.period = period
+
+        self.created = set()
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.server = None
+
+    def count(self, endpoint):
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def answer(self, data=None, code=0, description=success):
+        return {"code": code, "description": description, "data": data}
+
+    def handle(self, method, endpoint, body):
+        if endpoint == "/sm/session":
+            return self.answer(f"token-{random.getrandbits(64):016x}")
+
+        if endpoint == "/network/port":
+            return self.answer(self.interfaces)
+
+        if endpoint == "/network/nedevice":
+            return self.answer(self.devices)
+
+        if endpoint == "/network/slot":
+            return self.answer(self.slots.get(body.get("nedn"), []))
+
+        if endpoint == "/pm/realtimePerformance":
+            with self.lock:
+                if method == "DELETE":
+                    self.created.discard(body.get("taskID"))
+                    return self.answer()
+
+                if body.get("taskID") in self.created:
+                    return self.answer(code=1, description="The task already exists.")
+
+                self.created.add(body.get("taskID"))
+                return self.answer()
+
+        if endpoint == "/pm/historyByIndexKeys":
+            return self.answer([
+                history_entry(mo["dn"], mo["displayValue"], key["measUnitKey"], key["measTypeKey"], body["beginTime"], body["endTime"], self.period)
+                for mo in json.loads(body["mos"])
+                for key in json.loads(body["indexKeys"])
+            ])
+
+        return None
+
+    def handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep-alive, like the real eSight
+            protocol_version = "HTTP/1.1"
+
+            def reply(self, status, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def serve(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                endpoint = urlparse(self.path).path
+
+                # request counters for the benchmark, not part of eSight
+                if endpoint == "/_stats":
+                    with fake.lock:
+                        self.reply(200, dict(fake.requests))
+                    return
+
+                fake.count(endpoint)
+
+                if fake.latency:
+                    time.sleep(fake.latency)
+
+                if fake.error_rate and random.random() < fake.error_rate:
+                    self.reply(503, fake.answer(code=503, description="Service unavailable."))
+                    return
+
+                payload = fake.handle(self.command, endpoint, body)
+                if payload is None:
+                    self.reply(404, fake.answer(code=404, description="Not found."))
+                    return
+
+                self.reply(200, payload)
+
+            do_GET = do_PUT = do_POST = do_DELETE = serve
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self, host="127.0.0.1", port=0):
+        directory = tempfile.mkdtemp(prefix="fake-esight-")
+        cert, key = self_signed_certificate(directory)
+
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        self.server.daemon_threads = True
+        self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+
+        threading.Thread(target=self.server.serve_forever, name="fake-esight", daemon=True).start()
+        return self.server.server_address[1]
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="local HTTPS stand-in for eSight")
+    parser.add_argument("--tasks", type=int, default=1000, help="size of the inventory, in tasks")
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every answer")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of the requests answered with a 503")
+    args = parser.parse_args()
+
+    fake = Fake_Esight(args.tasks, args.latency, args.error_rate)
+    port = fake.start(port=args.port)
+
+    # the benchmark reads the port from the first line
+    print(port, flush=True)
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        fake.stop()
@@ -0,0 +1,101 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Description:
+# in-process stand-in for KafkaProducer, a sender thread acks the messages
+# every linger_ms (and flush waits for it), it only keeps counters, so the
+# benchmark measures our side of the producer
+
+import time
+import functools
+import threading
+
+class Fake_Future:
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.callbacks = []
+        self.errbacks = []
+
+    # extra arguments are bound before the metadata, as kafka-python does
+    def add_callback(self, func, *args, **kwargs):
+        self.callbacks.append(functools.partial(func, *args, **kwargs))
+        return self
+
+    def add_errback(self, func, *args, **kwargs):
+        self.errbacks.append(functools.partial(func, *args, **kwargs))
+        return self
+
+    def get(self, timeout=None):
+        return self.metadata
+
+    def succeed(self):
+        for func in self.callbacks:
+            func(self.metadata)
+
+class Fake_Metadata:
+
+    __slots__ = ("topic", "partition", "offset")
+
+    def __init__(self, topic, offset):
+        self.topic = topic
+        self.partition = 0
+        self.offset = offset
+
+class Fake_Producer:
+
+    def __init__(self, bootstrap_servers=None, **config):
+        self.config = config
+        self.linger = (config.get("linger_ms") or 0) / 1e3
+        self.lock = threading.Condition()
+        self.pending = []
+        self.acking = 0
+        self.messages = {}
+        self.bytes = 0
+        self.closed = False
+
+        # acks whatever was sent, like the sender thread of the real producer,
+        # so a caller blocked on max_in_flight is released without a flush
+        self.sender = threading.Thread(target=self.run, name="fake-kafka-sender", daemon=True)
+        self.sender.start()
+
+    def send(self, topic, value=None, key=None, headers=None):
+        with self.lock:
+            self.messages[topic] = self.messages.get(topic, 0) + 1
+            self.bytes += len(value or b"") + len(key or b"")
+            future = Fake_Future(Fake_Metadata(topic, self.messages[topic]))
+            self.pending.append(future)
+            self.lock.notify_all()
+
+        return future
+
+    def run(self):
+        while True:
+            with self.lock:
+                while not self.pending and not self.closed:
+                    self.lock.wait()
+                if self.closed and not self.pending:
+                    return
+
+            time.sleep(self.linger)
+
+            with self.lock:
+                pending, self.pending = self.pending, []
+                self.acking = len(pending)
+
+            for future in pending:
+                future.succeed()
+
+            with self.lock:
+                self.acking = 0
+                self.lock.notify_all()
+
+    def flush(self, timeout=None):
+        with self.lock:
+            self.lock.wait_for(lambda: not self.pending and not self.acking, timeout)
+
+    def close(self, timeout=None):
+        self.flush(timeout)
+        with self.lock:
+            self.closed = True
+            self.lock.notify_all()
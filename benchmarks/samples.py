@@ -0,0 +1,46 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Description:
+# synthetic eSight payloads shaped like the real historyByIndexKeys answers
+
+import random
+
+def history_entry(nedn, name, unit_key, type_key, start, end, period=5*60*1000):
+    return {
+        "dn": nedn,
+        "displayValue": name,
+        "measUnitKey": unit_key,
+        "measTypeKey": type_key,
+        "indexValues": [
+            {
+                "timestamp": timestamp,
+                "value": f"{random.uniform(0, 1e9):.2f}"
+            }
+            for timestamp in range(start - start % period + period, end + 1, period)
+        ]
+    }
+
+def interface_message(index, start, end):
+    # what main.py sends to esight_interface for one interface
+    nedn = f"NE={1000 + index // 48}"
+    name = f"GigabitEthernet0/{index // 48 % 8}/{index % 48}"
+    return {
+        name: {
+            "sending_rate": [history_entry(nedn, name, "ifXTrafficStat", "ifHCOutOctetsSpeed", start, end)],
+            "receiving_rate": [history_entry(nedn, name, "ifXTrafficStat", "ifHCInOctetsSpeed", start, end)]
+        }
+    }
+
+def slot_message(index, start, end):
+    # what main.py sends to esight_slot for one router
+    nedn = f"NE={1000 + index}"
+    msg = {}
+    for slot in range(4):
+        slotname = f"IPU {slot}"
+        name = "Slot:" + slotname.replace(" ", "%20")
+        msg[slotname] = {
+            "cpu_usage": [[history_entry(nedn, name, "CpuState", "cpuUsage", start, end)]],
+            "mem_usage": [[history_entry(nedn, name, "MemState", "memUsage", start, end)]]
+        }
+    return msg
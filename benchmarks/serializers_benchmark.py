@@ -0,0 +1,55 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Description:
+# compares payload size and encode time of the Kafka serializers on
+# messages shaped like the ones main.py builds from historyByIndexKeys
+#
+# usage: python benchmarks/serializers_benchmark.py [messages] [window minutes]
+
+import os
+import sys
+import json
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serializers import SERIALIZERS
+from samples import interface_message, slot_message
+
+def run(serializer, messages, rounds=5):
+    best = None
+    for _ in range(rounds):
+        encode_start = time.perf_counter()
+        size = sum(len(serializer(msg)) for msg in messages)
+        elapsed = time.perf_counter() - encode_start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return size, best
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    window = int(sys.argv[2]) if len(sys.argv) > 2 else 15
+
+    end = int(time.time()*1e3)
+    start = end - window*60*1000
+
+    workloads = {
+        "interfaces": [interface_message(i, start, end) for i in range(count)],
+        "slots": [slot_message(i, start, end) for i in range(max(count // 10, 1))]
+    }
+
+    candidates = {"json (indent=4)": lambda msg: json.dumps(msg, indent=4).encode("ascii")}
+    candidates.update({name: serializer.dumps for name, serializer in SERIALIZERS.items()})
+
+    for workload, messages in workloads.items():
+        print(f"\n{workload}: {len(messages)} messages, {window} minute window")
+        print(f"{'serializer':<18}{'bytes/msg':>12}{'us/msg':>10}{'MB/s':>10}")
+
+        for name, serializer in candidates.items():
+            size, elapsed = run(serializer, messages)
+            print(f"{name:<18}{size / len(messages):>12.0f}{elapsed / len(messages) * 1e6:>10.1f}{size / elapsed / 1e6:>10.1f}")
+
+    missing = [name for name in ("orjson", "msgpack") if name not in SERIALIZERS]
+    if missing:
+        print(f"\nnot installed: {', '.join(missing)}")
@@ -0,0 +1,115 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Description:
+# declarative catalog of the metrics collected from eSight, it decides which
+# tasks exist for a given inventory (provisioning) and how they are polled
+
+import json
+import logging
+
+from devices import Device, Slot
+from tasks import Task_Factory
+
+class Metric_Catalog:
+
+    def __init__(self, catalog):
+        logging.basicConfig(format='[%(levelname)s] - %(asctime)s -> %(message)s', level=logging.INFO, datefmt='%d-%m-%Y %H:%M:%S')
+
+        self.interface = catalog["interface"]
+        self.slot = catalog["slot"]
+
+        # device categories and physical classes are written with the names of
+        # the Device and Slot enums, a typo fails here instead of matching nothing
+        # slot_groups -> {necategory: groups}, each category lists its own groups
+        try:
+            self.slot_groups = {
+                Device[name].value: [
+                    dict(group, physical_class=Slot[group["physical_class"]].value)
+                    for group in category["groups"]
+                ]
+                for name, category in self.slot["categories"].items()
+            }
+        except KeyError as e:
+            raise ValueError(f"Unknown device category or slot class in the metric catalog: {e}")
+
+        self.device_categories = list(self.slot_groups)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            return cls(json.load(f))
+
+    @staticmethod
+    def spec(task_id, nedn, display, resource_type, metric, period):
+        # keyword arguments of Esight_Connector.create_task
+        return {
+            "task_id": task_id,
+            "nedn": nedn,
+            "name": display,
+            "resource_type": resource_type,
+            "group_key": metric["group_key"],
+            "indicators_data": json.dumps([{"indicatorKey": metric["indicator_key"], "symbol": "", "thresholdValue": ""}], separators=(",", ":")),
+            "period": period
+        }
+
+    def slot_group(self, necategory, slot):
+        # first matching group of the device category wins
+        for group in self.slot_groups.get(necategory, []):
+            if slot["physicalclass"] != group["physical_class"]:
+                continue
+            if "slotname_contains" in group and group["slotname_contains"] not in slot["slotname"]:
+                continue
+
+            return group
+
+        return None
+
+    def build_tasks(self, interfaces_list, network_devices_list, slots_lists):
+        # the tasks we want on eSight for the given inventory, slots_lists -> {nedn: slots}
+        # returns the create_task specs plus the tasks to poll, grouped by
+        # interface name and by device
+        factory = Task_Factory()
+        interfaces_tasks = {}
+        slots_tasks = {}
+        task_specs = []
+
+        # --- INTERFACES ---
+        for interface in interfaces_list:
+            if interface["operstatus"] in self.interface["exclude_operstatus"]:
+                continue
+
+            interfaces_tasks[interface["name"]] = {}
+            resource = factory.resource(interface["nedn"], interface["name"], interface["name"], self.interface["resource_type"])
+
+            for metric in self.interface["metrics"]:
+                task_id = f"orwell-{interface['name']}-{metric['suffix']}"
+                task_specs.append(self.spec(task_id, interface["nedn"], interface["name"], self.interface["resource_type"], metric, self.interface["period"]))
+                interfaces_tasks[interface["name"]][task_id] = factory.task(task_id, resource, metric["group_key"], metric["indicator_key"], metric["friendly_name"])
+
+        # --- SLOTS ---
+        for device in network_devices_list:
+            slots_tasks[device["nedn"]] = {}
+
+            if device["necategory"] not in self.device_categories:
+                continue
+
+            for slot in slots_lists.get(device["nedn"], []):
+                if slot["operstatus"] not in self.slot["operstatus"]:
+                    continue
+
+                group = self.slot_group(device["necategory"], slot)
+                if group is None:
+                    continue
+
+                display = "Slot:"+slot["slotname"].replace(" ", "%20")
+                resource = factory.resource(slot["nedn"], slot["slotname"], display, self.slot["resource_type"])
+
+                for metric in group["metrics"]:
+                    task_id = f"orwell-{slot['serialnum']}-{metric['suffix']}"
+                    task_specs.append(self.spec(task_id, slot["nedn"], display, self.slot["resource_type"], metric, self.slot["period"]))
+                    slots_tasks[device["nedn"]][task_id] = factory.task(task_id, resource, metric["group_key"], metric["indicator_key"], metric["friendly_name"])
+
+        logging.info(f"catalog: {len(task_specs)} tasks for {len(interfaces_tasks)} interfaces and {len(slots_tasks)} devices")
+
+        return task_specs, interfaces_tasks, slots_tasks
@@ -0,0 +1,104 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Description:
+# circuit breakers, something that keeps failing is skipped for a cooldown
+# period instead of slowing down (or killing) everything else
+
+import time
+import threading
+
+class Circuit_Breaker:
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, cooldown=5*60):
+        # opens after failure_threshold failures in a row, after cooldown seconds
+        # one call goes through (half open) and decides whether it closes again
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+                return True
+
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def release(self):
+        # the call let through half open neither succeeded nor failed (it was
+        # never made), back to open with the same opened_at so the next allow()
+        # tries again, instead of staying half open and refusing everything
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.trips += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "trips": self.trips
+            }
+
+class Breaker_Registry:
+
+    def __init__(self, failure_threshold=5, cooldown=5*60):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.breakers:
+                self.breakers[key] = Circuit_Breaker(self.failure_threshold, self.cooldown)
+
+            return self.breakers[key]
+
+    def allow(self, key):
+        return self.get(key).allow()
+
+    def open_keys(self):
+        with self.lock:
+            breakers = dict(self.breakers)
+
+        return [key for key, breaker in breakers.items() if breaker.state != Circuit_Breaker.CLOSED]
+
+    def stats(self):
+        with self.lock:
+            breakers = dict(self.breakers)
+
+        return {key: breaker.stats() for key, breaker in breakers.items()}
+
+    def samples(self, **labels):
+        # one gauge per breaker, 0 closed, 1 half open, 2 open
+        levels = {Circuit_Breaker.CLOSED: 0, Circuit_Breaker.HALF_OPEN: 1, Circuit_Breaker.OPEN: 2}
+        return [({**labels, "key": key}, levels[stats["state"]]) for key, stats in self.stats().items()]
@@ -0,0 +1,189 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Description:
+# concurrent metrics collection engine for the eSight tasks
+
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from watermarks import Watermark_Store
+from esight_exceptions import CircuitOpen
+
+class Metrics_Collector:
+
+    def __init__(self, esight, concurrency=8, watermarks=None, max_window=60*60*1000, breakers=None):
+        logging.basicConfig(format='[%(levelname)s] - %(asctime)s -> %(message)s', level=logging.INFO, datefmt='%d-%m-%Y %H:%M:%S')
+
+        self.esight = esight
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="collector")
+        self.last_cycle = {}
+
+        # watermarks -> Watermark_Store, where each task resumes from
+        # max_window -> longest range (ms) asked to eSight in a single request
+        self.watermarks = watermarks
+        self.max_window = max_window
+
+        # breakers -> Breaker_Registry keyed by nedn, a device that keeps failing
+        # is skipped for a cooldown period instead of failing every cycle
+        self.breakers = breakers
+
+    def plan(self, tasks, start, end):
+        # tasks resuming from the same watermark share their windows and batches
+        tasks_by_start = {}
+        for task_id, task in tasks.items():
+            task_start = start
+            if self.watermarks is not None:
+                task_start = self.watermarks.get(task_id, start)
+
+            tasks_by_start.setdefault(task_start, {})[task_id] = task
+
+        requests = []
+        for task_start, start_tasks in tasks_by_start.items():
+            for window_start, window_end in Watermark_Store.split_window(task_start, end, self.max_window):
+                for batch in self.esight.build_metrics_batches(start_tasks):
+                    requests.append((window_start, window_end, batch))
+
+        # oldest windows first, so results are merged in time order
+        requests.sort(key=lambda request: request[0])
+        return requests
+
+    def collect(self, tasks, start, end):
+        # tasks -> {task_id: Task}
+        # only the tasks that were collected are returned, the others keep
+        # their watermark and are asked again (from there) in the next cycle
+        cycle_start = time.monotonic()
+
+        allowed, skipped = self.healthy(tasks)
+
+        requests = self.plan(allowed, start, end)
+        futures = [
+            self.executor.submit(self.esight.get_batch_metrics, batch, window_start, window_end)
+            for window_start, window_end, batch in requests
+        ]
+
+        results = []
+        failed = set()
+        deferred = set()
+        devices_ok = set()
+        devices_failed = set()
+        for (window_start, window_end, batch), future in zip(requests, futures):
+            nedns = {key[0] for key in batch["tasks"]}
+            try:
+                results.append(future.result())
+                devices_ok |= nedns
+            except CircuitOpen:
+                # the endpoint is cooling down, no device is to blame
+                deferred.update(batch["tasks"].values())
+            except Exception:
+                if len(nedns) == 1:
+                    failed.update(batch["tasks"].values())
+                    devices_failed |= nedns
+                else:
+                    # a batch mixes devices, ask each one alone to find who is failing
+                    results.append(self.isolate(allowed, batch, window_start, window_end, failed, deferred, devices_ok, devices_failed))
+
+        # oldest windows first, failed and deferred tasks drop all of their windows
+        metrics = {task_id: [] for task_id in allowed if task_id not in failed and task_id not in deferred}
+        for result in results:
+            for task_id, task_metrics in result.items():
+                if task_id in metrics:
+                    metrics[task_id].extend(task_metrics or [])
+
+        if self.breakers is not None:
+            for nedn in devices_failed:
+                self.breakers.get(nedn).record_failure()
+            for nedn in devices_ok - devices_failed:
+                self.breakers.get(nedn).record_success()
+
+            # devices let through with no outcome (deferred, or no request at all)
+            # would stay half open forever, they are probed again next cycle
+            for nedn in {task.resource.nedn for task in allowed.values()} - devices_ok - devices_failed:
+                self.breakers.get(nedn).release()
+
+        if self.watermarks is not None:
+            self.watermarks.update(metrics, end)
+
+            # tasks that never had a watermark resume from this cycle's start
+            retry = [task_id for task_id in skipped | failed | deferred if self.watermarks.get(task_id) is None]
+            if retry:
+                self.watermarks.update(retry, start)
+
+        self.last_cycle = {
+            "tasks": len(tasks),
+            "requests": len(requests),
+            "failed": len(failed),
+            "skipped": len(skipped),
+            "deferred": len(deferred),
+            "duration": time.monotonic() - cycle_start,
+            "limits": self.esight.limits(),
+            "breakers": self.breaker_stats()
+        }
+        logging.info(f"collect: {self.last_cycle['tasks']} tasks in {self.last_cycle['requests']} requests, {self.last_cycle['duration']:.2f}s")
+        if self.last_cycle["limits"]:
+            logging.info(f"collect: eSight concurrency {self.last_cycle['limits']['concurrency']}")
+        if failed or skipped or deferred:
+            logging.warning(f"collect: {len(failed)} tasks failed, {len(skipped)} skipped, {len(deferred)} deferred, open devices {self.last_cycle['breakers']['open']}")
+
+        return metrics
+
+    def healthy(self, tasks):
+        # ask each breaker once per cycle, a half open device lets all of its tasks through
+        if self.breakers is None:
+            return tasks, set()
+
+        devices = {}
+        for task in tasks.values():
+            nedn = task.resource.nedn
+            if nedn not in devices:
+                devices[nedn] = self.breakers.allow(nedn)
+
+        allowed = {task_id: task for task_id, task in tasks.items() if devices[task.resource.nedn]}
+        return allowed, set(tasks) - set(allowed)
+
+    def isolate(self, tasks, batch, start, end, failed, deferred, devices_ok, devices_failed):
+        tasks_by_nedn = {}
+        for key, task_id in batch["tasks"].items():
+            tasks_by_nedn.setdefault(key[0], {})[task_id] = tasks[task_id]
+
+        futures = {
+            nedn: [
+                self.executor.submit(self.esight.get_batch_metrics, device_batch, start, end)
+                for device_batch in self.esight.build_metrics_batches(device_tasks)
+            ]
+            for nedn, device_tasks in tasks_by_nedn.items()
+        }
+
+        metrics = {}
+        for nedn, device_futures in futures.items():
+            device_metrics = {}
+            try:
+                for future in device_futures:
+                    device_metrics.update(future.result())
+            except CircuitOpen:
+                deferred.update(tasks_by_nedn[nedn])
+                continue
+            except Exception:
+                failed.update(tasks_by_nedn[nedn])
+                devices_failed.add(nedn)
+                continue
+
+            metrics.update(device_metrics)
+            devices_ok.add(nedn)
+
+        return metrics
+
+    def breaker_stats(self):
+        # per-device and per-endpoint breaker state, as metrics
+        devices = self.breakers.stats() if self.breakers is not None else {}
+
+        return {
+            "open": sorted(nedn for nedn, stats in devices.items() if stats["state"] != "closed"),
+            "devices": devices,
+            "endpoints": self.esight.breaker_stats()
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
@@ -11,8 +11,102 @@ class Settings(BaseSettings):
     ESIGHT_USERNAME: str = os.getenv("ESIGHT_USER")
     ESIGHT_PASSWORD: str = os.getenv("ESIGHT_PASS")
     ESIGHT_LOCATION: str = os.getenv("ESIGHT_URL")
+    ESIGHT_POOL_CONNECTIONS: int = 10
+    ESIGHT_POOL_MAXSIZE: int = 10
+    ESIGHT_TOKEN_LIFETIME: int = 30 * 60
+    ESIGHT_TOKEN_REFRESH_MARGIN: int = 60
+    ESIGHT_BATCH_SIZE: int = 100
+    # devices whose slots are fetched at the same time
+    ESIGHT_DISCOVERY_CONCURRENCY: int = 8
+    # requests per second of each endpoint, 0 for no limit
+    ESIGHT_RATE_LIMIT: float = 20
+    ESIGHT_RATE_BURST: int = 40
+    # adaptive concurrency, starts at ESIGHT_CONCURRENCY_INITIAL and moves between the bounds
+    ESIGHT_CONCURRENCY_INITIAL: int = 4
+    ESIGHT_CONCURRENCY_MIN: int = 1
+    ESIGHT_CONCURRENCY_MAX: int = 10
+    # seconds, slower answers count as overload
+    ESIGHT_LATENCY_TARGET: float = 2.0
+    # transient failures are retried with exponential backoff (s) and full jitter
+    ESIGHT_RETRIES: int = 3
+    ESIGHT_BACKOFF: float = 0.5
+    ESIGHT_BACKOFF_MAX: float = 10
+    # an endpoint or device failing this many times in a row is skipped for the cooldown (s)
+    ESIGHT_BREAKER_THRESHOLD: int = 3
+    ESIGHT_BREAKER_COOLDOWN: int = 5 * 60
+    # "record" keeps every eSight answer in ESIGHT_TRAFFIC_ARCHIVE, "replay" answers from it
+    # without a network, fast or at the recorded latency (ESIGHT_RATE_LIMIT=0 to replay unthrottled)
+    ESIGHT_TRAFFIC_MODE: str = ""
+    ESIGHT_TRAFFIC_ARCHIVE: str = "state/esight-traffic.gz"
+    ESIGHT_REPLAY_TIMING: str = "fast"
+
+    # COLLECTOR ENV
+    # keep it at or below ESIGHT_POOL_MAXSIZE, extra workers would only wait for a connection
+    COLLECTOR_CONCURRENCY: int = 8
+    # longest range (s) asked in one request, longer gaps are split and fetched in parallel
+    COLLECTOR_MAX_WINDOW: int = 60 * 60
+    PROVISIONING_CONCURRENCY: int = 8
+    METRIC_CATALOG_PATH: str = "metric_catalog.json"
+    TASK_REGISTRY_PATH: str = "state/tasks.json"
+    WATERMARKS_PATH: str = "state/watermarks.json"
+    INVENTORY_PATH: str = "state/inventory.json"
+    # backfill.py, progress of the last backfill and windows fetched ahead of the one being published
+    BACKFILL_STATE_PATH: str = "state/backfill.json"
+    BACKFILL_PARALLEL_WINDOWS: int = 4
+    # seconds between two inventory refreshes
+    INVENTORY_REFRESH_INTERVAL: int = 60 * 60
+
+    # READINESS ENV
+    READINESS_SAMPLE_SIZE: int = 20
+    READINESS_POLL_INTERVAL: int = 30
+    READINESS_MAX_WAIT: int = 20 * 60
+
+    # SCHEDULER ENV
+    # intervals in seconds, runs fire on wall-clock multiples of them
+    INTERFACES_INTERVAL: int = 15 * 60
+    SLOTS_INTERVAL: int = 15 * 60
+    SCHEDULER_JITTER: int = 30
+
+    # METRICS ENV
+    # Prometheus-style endpoint at http://METRICS_HOST:METRICS_PORT/metrics, 0 disables it
+    METRICS_HOST: str = "0.0.0.0"
+    METRICS_PORT: int = 9108
 
     # KAFKA ENV
     KAFKA_LOCATION: str = os.getenv("KAFKA_URL")
+    KAFKA_LINGER_MS: int = 50
+    KAFKA_BATCH_SIZE: int = 256 * 1024
+    # gzip, snappy, lz4 or zstd, empty to send uncompressed
+    KAFKA_COMPRESSION: str = ""
+    # 0, 1 or all
+    KAFKA_ACKS: str = "1"
+    KAFKA_MAX_IN_FLIGHT: int = 10000
+    # json (compact), orjson or msgpack, the last two need their packages installed
+    KAFKA_SERIALIZER: str = "json"
+    # undelivered messages wait here until the broker is back
+    KAFKA_SPOOL_DIR: str = "state/spool"
+    KAFKA_SPOOL_SEGMENT_BYTES: int = 16 * 1024 * 1024
+    KAFKA_SPOOL_MAX_BYTES: int = 1024 * 1024 * 1024
+    # messages per second
+    KAFKA_SPOOL_REPLAY_RATE: int = 1000
+    # failed attempts before asking the discovery endpoint for the broker again
+    KAFKA_REDISCOVER_AFTER: int = 3
+
+    # OUTPUT ENV
+    # nested -> one message per interface / router on esight_interface and esight_slot
+    # records -> one message per sample, keyed by nedn, on the records topics (no local files)
+    OUTPUT_MODE: str = "nested"
+    KAFKA_INTERFACE_RECORDS_TOPIC: str = "esight_interface_records"
+    KAFKA_SLOT_RECORDS_TOPIC: str = "esight_slot_records"
+
+    # ndjson -> local copy of the nested messages, none -> no local files
+    OUTPUT_SINK: str = "ndjson"
+    OUTPUT_DIR: str = "outputs"
+    OUTPUT_ROTATE_BYTES: int = 64 * 1024 * 1024
+    OUTPUT_ROTATE_SECONDS: int = 60 * 60
+    # gzip or zstd (needs the zstandard package), empty for plain files
+    OUTPUT_COMPRESSION: str = ""
+    # files kept per stream
+    OUTPUT_RETENTION: int = 48
 
 config = Settings()
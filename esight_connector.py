@@ -7,26 +7,286 @@
 # Description:
 # eSight Adapter to get 5G Core metrics
 
+import re
 import time
 import json
+import random
+import itertools
 import logging
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 
-from esight_exceptions import CouldNotLoginOnEsight, UnexpectedError
+from json_stream import iter_array_items
+from esight_exceptions import CircuitOpen, CouldNotLoginOnEsight, TaskAlreadyExists, UnexpectedError
 
 class Esight_Connector:
     auth_token = ""
-    expires_at = ""
+    expires_at = 0
     system_id = "NMSinfo3"
+    auth_failed_description = "openid auth failed."
 
-    def __init__(self, address, username, password):
+    # what eSight says when a task ID is taken, "does not exist" and the like
+    # are other errors and must not pass for an existing task
+    task_exists_description = re.compile(r"(?<!not )\balready exists?\b", re.IGNORECASE)
+    default_headers = {
+        'Content-Type': 'application/json',
+        'Accept': 'application/json'
+    }
+
+    def __init__(self, address, username, password, pool_connections=10, pool_maxsize=10, pool_block=True, headers=None, token_lifetime=30*60, refresh_margin=60, batch_size=100, limiter=None, retries=3, backoff=0.5, backoff_max=10, breakers=None, metrics=None, recorder=None, replayer=None):
         logging.basicConfig(format='[%(levelname)s] - %(asctime)s -> %(message)s', level=logging.INFO, datefmt='%d-%m-%Y %H:%M:%S')
 
         self.address = address
         self.username = username
         self.password = password
+
+        # eSight does not tell us when an openid expires, so we keep our own
+        # estimate and renew it refresh_margin seconds before that moment
+        self.token_lifetime = token_lifetime
+        self.refresh_margin = refresh_margin
+        self.auth_lock = threading.Lock()
+
+        # max number of (MO, indicator) series asked in one historyByIndexKeys call
+        self.batch_size = batch_size
+
+        # limiter -> Esight_Limiter, client-side load control (None disables it)
+        self.limiter = limiter
+
+        # transient failures (timeouts, refused connections, 429 and 5xx) are retried
+        # up to retries times, waiting a random time below backoff * 2^attempt seconds
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+
+        # breakers -> Breaker_Registry keyed by endpoint, an endpoint that keeps
+        # failing is not called at all until its cooldown is over (None disables it)
+        self.breakers = breakers
+
+        # metrics -> Metrics_Registry, latency, payload size and errors per endpoint
+        self.metrics = metrics
+        if self.metrics is not None:
+            self.metrics.describe("esight_request_duration_seconds", "histogram", "Time until eSight answered, per endpoint")
+            self.metrics.describe("esight_response_bytes_total", "counter", "Response payload bytes read from eSight, per endpoint")
+            self.metrics.describe("esight_request_errors_total", "counter", "Failed eSight requests, per endpoint and error")
+            self.metrics.describe("esight_request_retries_total", "counter", "eSight requests retried after a transient error, per endpoint")
+
+        # recorder -> Traffic_Recorder, every answer is also written to its archive
+        # replayer -> Traffic_Replayer, answers come from an archive, eSight is never called
+        self.recorder = recorder
+        self.replayer = replayer
+
+        # one keep-alive session shared by every endpoint, so TCP connections
+        # and TLS sessions are reused instead of being opened on each call
+        # pool_connections -> number of hosts kept in the pool
+        # pool_maxsize -> connections kept open per host
+        # pool_block -> never open more than pool_maxsize connections per host
+        self.adapter = HTTPAdapter(
+            pool_connections = pool_connections,
+            pool_maxsize = pool_maxsize,
+            pool_block = pool_block
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", self.adapter)
+        self.session.verify = False
+        self.session.headers.update(self.default_headers)
+        if headers:
+            self.session.headers.update(headers)
+
         self.authenticate()
 
+    def _request(self, method, endpoint, auth=True, send=None, **kwargs):
+        # send -> how the answer is read, _send by default, _stream for large lists
+        breaker = self.breakers.get(endpoint) if self.breakers else None
+        if breaker and not breaker.allow():
+            raise CircuitOpen(endpoint)
+
+        try:
+            response_data = self._request_with_retries(method, endpoint, auth, send or self._send, **kwargs)
+        except Exception:
+            if breaker:
+                breaker.record_failure()
+            raise
+
+        if breaker:
+            breaker.record_success()
+
+        return response_data
+
+    def _request_with_retries(self, method, endpoint, auth, send, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return self._request_once(method, endpoint, auth, send, **kwargs)
+            except Exception as e:
+                if attempt >= self.retries or not self.is_transient(e):
+                    raise
+
+                # full jitter, so callers failing together do not retry together
+                delay = random.uniform(0, min(self.backoff * 2 ** attempt, self.backoff_max))
+                attempt += 1
+                if self.metrics is not None:
+                    self.metrics.inc("esight_request_retries_total", endpoint=endpoint)
+                logging.info(f"{endpoint}: {type(e).__name__}, retry {attempt}/{self.retries} in {delay:.2f}s")
+                time.sleep(delay)
+
+    @staticmethod
+    def is_transient(error):
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return True
+
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            return error.response.status_code == 429 or error.response.status_code >= 500
+
+        return False
+
+    def _request_once(self, method, endpoint, auth, send, **kwargs):
+        # renew ahead of expiry on every endpoint, not only the decorated ones,
+        # the polling hot path would otherwise pay a rejected round trip each time
+        if auth:
+            self.update_auth_token()
+
+        token = self.auth_token
+        response_data = send(method, endpoint, token if auth else None, **kwargs)
+
+        # eSight dropped the session before our local estimate said it would,
+        # log in again (only once for all the callers using that token) and replay
+        if auth and response_data.get("description") == self.auth_failed_description:
+            logging.info(f"{endpoint}: openid rejected, authenticating again")
+            self.refresh_auth_token(token, force=True)
+            response_data = send(method, endpoint, self.auth_token, **kwargs)
+
+        return response_data
+
+    def _send(self, method, endpoint, token, **kwargs):
+        response = self._open(method, endpoint, token, **kwargs)
+
+        if self.metrics is not None:
+            self.metrics.inc("esight_response_bytes_total", len(response.content), endpoint=endpoint)
+
+        # get data
+        return json.loads(response.text)
+
+    def _stream(self, method, endpoint, token, key="data", **kwargs):
+        # the answer is parsed while it is downloaded, key holds an iterator over
+        # its items and the other members are filled in as they are read; the
+        # first item is read ahead, so an answer without items (a rejected openid)
+        # is complete when it is returned
+        response = self._open(method, endpoint, token, stream = True, **kwargs)
+        response_data = {}
+        try:
+            items = iter_array_items(self._count_bytes(endpoint, response.iter_content(chunk_size=64*1024)), key, response_data)
+            ahead = list(itertools.islice(items, 1))
+        except Exception:
+            response.close()
+            raise
+
+        if not ahead:
+            response.close()
+
+        response_data[key] = self._read_items(response, ahead, items)
+        return response_data
+
+    @staticmethod
+    def _read_items(response, ahead, items):
+        try:
+            yield from ahead
+            yield from items
+        finally:
+            response.close()
+
+    def _count_bytes(self, endpoint, chunks):
+        # streamed bodies are counted as they are read
+        for chunk in chunks:
+            if self.metrics is not None:
+                self.metrics.inc("esight_response_bytes_total", len(chunk), endpoint=endpoint)
+            yield chunk
+
+    def _open(self, method, endpoint, token, **kwargs):
+        headers = kwargs.pop("headers", {})
+        if token is not None:
+            headers["openid"] = f"{token}"
+
+        # wait for a token of this endpoint and a free concurrency slot
+        started_at = self.limiter.acquire(endpoint) if self.limiter else None
+        request_start = time.monotonic()
+        try:
+            if self.replayer is not None:
+                response = self.replayer.response(method, endpoint, kwargs.get("data"))
+            else:
+                # passed on each call, REQUESTS_CA_BUNDLE would override the session setting
+                response = self.session.request(
+                    method,
+                    f"https://{self.address}{endpoint}",
+                    headers = headers,
+                    verify = self.session.verify,
+                    **kwargs
+                )
+
+                if self.recorder is not None:
+                    self.recorder.record(method, endpoint, kwargs.get("data"), response, time.monotonic() - request_start)
+
+            # check response status
+            response.raise_for_status()
+        except Exception as e:
+            # timeouts, refused connections and HTTP errors tell eSight is struggling
+            if self.limiter:
+                self.limiter.release(started_at, error=True)
+            if self.metrics is not None:
+                self.metrics.inc("esight_request_errors_total", endpoint=endpoint, error=type(e).__name__)
+            raise
+
+        if self.limiter:
+            self.limiter.release(started_at)
+        if self.metrics is not None:
+            self.metrics.observe("esight_request_duration_seconds", time.monotonic() - request_start, endpoint=endpoint, method=method)
+
+        return response
+
+    def limits(self):
+        # current client-side limits, as metrics
+        if not self.limiter:
+            return {}
+
+        return self.limiter.stats()
+
+    def breaker_stats(self):
+        # state of the per-endpoint breakers, as metrics
+        if not self.breakers:
+            return {}
+
+        return self.breakers.stats()
+
+    def pool_stats(self):
+        # urllib3 keeps one connection pool per host, each one counting
+        # the connections it had to open and the requests it served
+        stats = {
+            "hosts": 0,
+            "connections_opened": 0,
+            "requests": 0,
+            "connections_reused": 0
+        }
+
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+
+            stats["hosts"] += 1
+            stats["connections_opened"] += pool.num_connections
+            stats["requests"] += pool.num_requests
+
+        stats["connections_reused"] = max(stats["requests"] - stats["connections_opened"], 0)
+        return stats
+
+    def close(self):
+        self.session.close()
+
+        if self.recorder is not None:
+            self.recorder.close()
+
     # DECORATORS
     # Auth Decorator
     def requires_auth(func, *args, **kwargs):
@@ -34,34 +294,29 @@ class Esight_Connector:
             try:
                 self.update_auth_token()
                 return func(self, *args, **kwargs)
+            except (TaskAlreadyExists, CircuitOpen):
+                raise
             except Exception as e:
                 logging.exception("Auth Required: To call this function you need to be authenticated in eSight! - " + str(e))
                 raise UnexpectedError("Auth Required: To call this function you need to be authenticated in eSight! - " + str(e))
         return wrapper
 
-    def update_auth_token(self):
-        # Avoid getting "Adding certificate verification is strongly advised" warnings
-        requests.packages.urllib3.disable_warnings()
-
-        response = requests.get(
-            f"https://{self.address}/network/port",
-            headers = {
-                "openid": f"{self.auth_token}"
-            },
-            timeout = 5,
-            verify = False
-        )
+    def token_expiring(self):
+        return not self.auth_token or time.time() >= self.expires_at - self.refresh_margin
 
-        # check response status
-        response.raise_for_status()
+    def update_auth_token(self):
+        if self.token_expiring():
+            self.refresh_auth_token(self.auth_token)
 
-        # get data
-        response_data = json.loads(response.text)
+    def refresh_auth_token(self, stale_token, force=False):
+        # single-flight: whoever gets the lock first logs in, everyone
+        # waiting on it finds a new token and goes on with it
+        with self.auth_lock:
+            if self.auth_token != stale_token:
+                return
 
-        if response_data["description"] == "openid auth failed.":
-            self.authenticate()
-        elif response_data["description"] != "Operation success":
-            raise UnexpectedError("Something happened, check your connection.")
+            if force or self.token_expiring():
+                self.authenticate()
 
     def authenticate(self):
         try:
@@ -71,28 +326,17 @@ class Esight_Connector:
                 "value": self.password,
             })
 
-            # Avoid getting "Adding certificate verification is strongly advised" warnings
-            requests.packages.urllib3.disable_warnings()
-
-            response = requests.put(
-                f"https://{self.address}/sm/session",
-                headers = {
-                    'Content-Type': 'application/json',
-                    'Accept': 'application/json'
-                },
+            response_data = self._request(
+                "PUT",
+                "/sm/session",
+                auth = False,
                 data = data,
-                timeout = 5,
-                verify = False
+                timeout = 5
             )
 
-            # check response status
-            response.raise_for_status()
-
-            # get data
-            response_data = json.loads(response.text)
-
             if response_data["description"] == "Operation success.":
                 self.auth_token = response_data["data"]
+                self.expires_at = time.time() + self.token_lifetime
             else:
                 raise CouldNotLoginOnEsight()
 
@@ -103,24 +347,12 @@ class Esight_Connector:
     def get_interfaces_list(self):
         try:
 
-            # Avoid getting "Adding certificate verification is strongly advised" warnings
-            requests.packages.urllib3.disable_warnings()
-
-            response = requests.get(
-                f"https://{self.address}/network/port",
-                headers = {
-                    'openid': f'{self.auth_token}'
-                },
-                timeout = 5,
-                verify = False
+            response_data = self._request(
+                "GET",
+                "/network/port",
+                timeout = 5
             )
 
-            # check response status
-            response.raise_for_status()
-
-            # get data
-            response_data = json.loads(response.text)
-
             if response_data["code"] != 0:
                 logging.info(f"get_interfaces_list: Something happened, could not get sending rate for interface {name}.")
                 raise UnexpectedError(f"Something happened, could not get sending rate for interface {name}.")
@@ -134,6 +366,37 @@ class Esight_Connector:
             raise CouldNotLoginOnEsight()
             return []
 
+    def iter_interfaces(self, fields=("name", "nedn", "operstatus")):
+        # same as get_interfaces_list, but the body is parsed while it is downloaded
+        # and only the given fields of each interface are kept, so memory stays
+        # flat no matter how many ports eSight knows about; opening it goes through
+        # the same retries, breaker and openid renewal as every other request
+        try:
+            response_data = self._request("GET", "/network/port", send = self._stream, timeout = 5)
+        except CircuitOpen:
+            raise
+        except Exception:
+            logging.exception("iter_interfaces: Error")
+            raise UnexpectedError("Something happened, could not get the interfaces list.")
+
+        count = 0
+        interfaces = response_data["data"]
+        try:
+            for interface in interfaces:
+                count += 1
+                yield {field: interface.get(field) for field in fields}
+        except ValueError as e:
+            logging.exception("iter_interfaces: Error")
+            raise UnexpectedError(f"Something happened, could not parse the interfaces list - {e}")
+        finally:
+            interfaces.close()
+
+        if response_data.get("code") != 0:
+            logging.info(f"iter_interfaces: Something happened, eSight answered {response_data.get('description')}.")
+            raise UnexpectedError("Something happened, could not get the interfaces list.")
+
+        logging.info(f"iter_interfaces: OK ({count} interfaces)")
+
     @requires_auth
     def create_task(self, task_id, nedn, name, resource_type, group_key, indicators_data, period):
         try:
@@ -148,28 +411,18 @@ class Esight_Connector:
                 'periodType': period
             })
 
-            # Avoid getting "Adding certificate verification is strongly advised" warnings
-            requests.packages.urllib3.disable_warnings()
-
-            response = requests.put(
-                f"https://{self.address}/pm/realtimePerformance",
-                headers = {
-                    'openid': f'{self.auth_token}',
-                    'Content-Type': 'application/json',
-                    'Accept': 'application/json'
-                },
+            response_data = self._request(
+                "PUT",
+                "/pm/realtimePerformance",
                 data = data,
-                timeout = 5,
-                verify = False
+                timeout = 5
             )
-
-            # check response status
-            response.raise_for_status()
-
-            # get data
-            response_data = json.loads(response.text)
             
             if response_data["code"] != 0:
+                # creating a task twice is not an error for us, the caller decides what to do
+                if self.task_exists_description.search(str(response_data.get("description", ""))):
+                    raise TaskAlreadyExists(task_id)
+
                 logging.info(response_data)
                 logging.exception(f"create_task: Something happened, could not create task for {name}.")
 
@@ -178,6 +431,8 @@ class Esight_Connector:
             logging.info("create_task: OK")
             return True
 
+        except TaskAlreadyExists:
+            raise
         except:
             logging.exception(f"create_task: Error")
             raise UnexpectedError(f"Something happened, could not create task for {name}.")
@@ -192,35 +447,21 @@ class Esight_Connector:
                 'taskID': task_id
             })
 
-            # Avoid getting "Adding certificate verification is strongly advised" warnings
-            requests.packages.urllib3.disable_warnings()
-
-            response = requests.delete(
-                f"https://{self.address}/pm/realtimePerformance",
-                headers = {
-                    'openid': f'{self.auth_token}',
-                    'Content-Type': 'application/json',
-                    'Accept': 'application/json'
-                },
+            response_data = self._request(
+                "DELETE",
+                "/pm/realtimePerformance",
                 data = data,
-                timeout = 5,
-                verify = False
+                timeout = 5
             )
-
-            # check response status
-            response.raise_for_status()
-
-            # get data
-            response_data = json.loads(response.text)
             
             if response_data["code"] != 0:
-                logging.info(f"delete_task: Something happened, could not create task for {name}.")
-                raise UnexpectedError(f"Something happened, could not create task for {name}.")
+                logging.info(f"delete_task: Something happened, could not delete task {task_id}.")
+                raise UnexpectedError(f"Something happened, could not delete task {task_id}.")
 
             logging.info("delete_task: OK")
         except:
             logging.exception("delete_task: Error")
-            raise UnexpectedError(f"Something happened, could not create task for {name}.")
+            raise UnexpectedError(f"Something happened, could not delete task {task_id}.")
 
     def get_interface_sending_rate(self, nedn, name, start, finish):
         try:
@@ -232,27 +473,13 @@ class Esight_Connector:
                 'endTime': finish
             })
 
-            # Avoid getting "Adding certificate verification is strongly advised" warnings
-            requests.packages.urllib3.disable_warnings()
-
-            response = requests.post(
-                f"https://{self.address}/pm/historyByIndexKeys",
-                headers = {
-                    'openid': f'{self.auth_token}',
-                    'Content-Type': 'application/json',
-                    'Accept': 'application/json'
-                },
+            response_data = self._request(
+                "POST",
+                "/pm/historyByIndexKeys",
                 data = data,
-                timeout = 5,
-                verify = False
+                timeout = 5
             )
 
-            # check response status
-            response.raise_for_status()
-
-            # get data
-            response_data = json.loads(response.text)
-
             if response_data["code"] != 0:
                 logging.info(f"get_interface_sending_rate: Something happened, could not get sending rate for interface {name}.")
                 raise UnexpectedError(f"Something happened, could not get sending rate for interface {name}.")
@@ -276,27 +503,13 @@ class Esight_Connector:
                 'endTime': finish
             })
 
-            # Avoid getting "Adding certificate verification is strongly advised" warnings
-            requests.packages.urllib3.disable_warnings()
-
-            response = requests.post(
-                f"https://{self.address}/pm/historyByIndexKeys",
-                headers = {
-                    'openid': f'{self.auth_token}',
-                    'Content-Type': 'application/json',
-                    'Accept': 'application/json'
-                },
+            response_data = self._request(
+                "POST",
+                "/pm/historyByIndexKeys",
                 data = data,
-                timeout = 5,
-                verify = False
+                timeout = 5
             )
 
-            # check response status
-            response.raise_for_status()
-
-            # get data
-            response_data = json.loads(response.text)
-
             if response_data["code"] != 0:
                 logging.info(f"get_interface_receiving_rate: Something happened, could not get receiving rate for interface {name}.")
                 raise UnexpectedError(f"Something happened, could not get receiving rate for interface {name}.")
@@ -314,26 +527,12 @@ class Esight_Connector:
     def get_network_devices_list(self):
         try:
 
-            # Avoid getting "Adding certificate verification is strongly advised" warnings
-            requests.packages.urllib3.disable_warnings()
-
-            response = requests.get(
-                f"https://{self.address}/network/nedevice",
-                headers = {
-                    'openid': f'{self.auth_token}',
-                    'Content-Type': 'application/json',
-                    'Accept': 'application/json'
-                },
-                timeout = 5,
-                verify = False
+            response_data = self._request(
+                "GET",
+                "/network/nedevice",
+                timeout = 5
             )
 
-            # check response status
-            response.raise_for_status()
-
-            # get data
-            response_data = json.loads(response.text)
-
             if response_data["code"] != 0:
                 logging.info(f"get_network_devices_list: Something happened, could not get receiving rate for interface {name}.")
                 raise UnexpectedError(f"Something happened, could not get receiving rate for interface {name}.")
@@ -355,27 +554,13 @@ class Esight_Connector:
                 'nedn': nedn
             })
 
-            # Avoid getting "Adding certificate verification is strongly advised" warnings
-            requests.packages.urllib3.disable_warnings()
-
-            response = requests.get(
-                f"https://{self.address}/network/slot",
-                headers = {
-                    'openid': f'{self.auth_token}',
-                    'Content-Type': 'application/json',
-                    'Accept': 'application/json'
-                },
+            response_data = self._request(
+                "GET",
+                "/network/slot",
                 data = data,
-                timeout = 5,
-                verify = False
+                timeout = 5
             )
 
-            # check response status
-            response.raise_for_status()
-
-            # get data
-            response_data = json.loads(response.text)
-
             if response_data["code"] != 0:
                 logging.info(f"get_slots_list: Something happened, could not get receiving rate for interface {name}.")
                 raise UnexpectedError(f"Something happened, could not get receiving rate for interface {name}.")
@@ -389,6 +574,22 @@ class Esight_Connector:
             raise CouldNotLoginOnEsight()
             return []
 
+    def get_slots_lists(self, nedns, max_workers=8):
+        # slots of many devices at once, a device that fails is logged and left out
+        slots = {}
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="slots") as executor:
+            futures = {executor.submit(self.get_slots_list, nedn): nedn for nedn in nedns}
+
+            for future in as_completed(futures):
+                try:
+                    slots[futures[future]] = future.result()
+                except Exception:
+                    logging.error(f"get_slots_lists: could not get slots of {futures[future]}")
+
+        logging.info(f"get_slots_lists: {len(slots)} of {len(futures)} devices OK")
+        return slots
+
     def get_task_metrics(self, nedn, name, resource_type, unit_key, type_key, start, finish):
         try:
 
@@ -399,27 +600,13 @@ class Esight_Connector:
                 'endTime': finish
             })
 
-            # Avoid getting "Adding certificate verification is strongly advised" warnings
-            requests.packages.urllib3.disable_warnings()
-
-            response = requests.post(
-                f"https://{self.address}/pm/historyByIndexKeys",
-                headers = {
-                    'openid': f'{self.auth_token}',
-                    'Content-Type': 'application/json',
-                    'Accept': 'application/json'
-                },
+            response_data = self._request(
+                "POST",
+                "/pm/historyByIndexKeys",
                 data = data,
-                timeout = 5,
-                verify = False
+                timeout = 5
             )
 
-            # check response status
-            response.raise_for_status()
-
-            # get data
-            response_data = json.loads(response.text)
-
             if response_data["code"] != 0:
                 logging.info(f"get_task_metrics: Something happened, could not get task metrics {name}.")
                 raise UnexpectedError(f"Something happened, could not get task metrics {name}.")
@@ -434,3 +621,99 @@ class Esight_Connector:
             return json.loads({})        
 
 
+
+    def build_metrics_batches(self, tasks):
+        # tasks -> {task_id: Task}
+        # historyByIndexKeys answers the cross product of "mos" and "indexKeys",
+        # so MOs are grouped by the exact set of indicators they need and each
+        # group is cut so that no request asks for more than batch_size series
+        resources = {}
+        for task in tasks.values():
+            resources.setdefault(task.resource, []).append(task)
+
+        groups = {}
+        for resource, resource_tasks in resources.items():
+            groups.setdefault(tuple(sorted({task.index_key for task in resource_tasks})), []).append(resource)
+
+        batches = []
+        for index_keys, group in groups.items():
+            mos_per_batch = max(self.batch_size // len(index_keys), 1)
+
+            for i in range(0, len(group), mos_per_batch):
+                batch_resources = group[i:i + mos_per_batch]
+
+                # payload fragments were serialized once, when the tasks were built
+                batches.append({
+                    "mos": "[" + ",".join(resource.mo for resource in batch_resources) + "]",
+                    "indexKeys": "[" + ",".join(index_keys) + "]",
+                    "tasks": {
+                        (task.resource.nedn, task.resource.display, task.unit_key, task.type_key): task.task_id
+                        for resource in batch_resources
+                        for task in resources[resource]
+                    }
+                })
+
+        return batches
+
+    def get_batch_metrics(self, batch, start, finish):
+        try:
+
+            data = json.dumps({
+                'mos': batch["mos"],
+                'indexKeys': batch["indexKeys"],
+                'beginTime': start,
+                'endTime': finish
+            })
+
+            response_data = self._request(
+                "POST",
+                "/pm/historyByIndexKeys",
+                data = data,
+                timeout = 5
+            )
+
+            if response_data["code"] != 0:
+                logging.info(f"get_batch_metrics: Something happened, could not get metrics for {len(batch['tasks'])} tasks.")
+                raise UnexpectedError(f"Something happened, could not get metrics for {len(batch['tasks'])} tasks.")
+
+            logging.info(f"get_batch_metrics: OK ({len(batch['tasks'])} tasks)")
+            return self.split_batch_metrics(batch, response_data["data"])
+
+        except CircuitOpen:
+            # not this batch's fault, the caller leaves it for the next cycle
+            raise
+        except:
+            logging.exception("get_batch_metrics: Error")
+            raise UnexpectedError(f"Something happened, could not get metrics for {len(batch['tasks'])} tasks.")
+
+    def split_batch_metrics(self, batch, data):
+        metrics = {task_id: [] for task_id in batch["tasks"].values()}
+
+        # a single series is exactly what get_task_metrics would return
+        if len(metrics) == 1:
+            metrics[next(iter(metrics))] = data
+            return metrics
+
+        # every series eSight returns carries the MO and the index key it answers
+        for entry in data or []:
+            task_id = batch["tasks"].get((
+                entry.get("dn"),
+                entry.get("displayValue"),
+                entry.get("measUnitKey"),
+                entry.get("measTypeKey")
+            ))
+
+            if task_id is None:
+                logging.warning(f"get_batch_metrics: unexpected series for {entry.get('dn')} - {entry.get('measTypeKey')}")
+                continue
+
+            metrics[task_id].append(entry)
+
+        return metrics
+
+    def get_tasks_metrics(self, tasks, start, finish):
+        metrics = {}
+        for batch in self.build_metrics_batches(tasks):
+            metrics.update(self.get_batch_metrics(batch, start, finish))
+
+        return metrics
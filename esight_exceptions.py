@@ -20,3 +20,30 @@ class UnexpectedError(Exception):
 
     def __str__(self):
         return self.message
+
+class TaskAlreadyExists(Exception):
+    def __init__(self, task_id):
+        self.status_code = HTTPStatus.CONFLICT
+        self.message = f'Task "{task_id}" already exists on eSight'
+        super().__init__(self.message)
+
+    def __str__(self):
+        return self.message
+
+class NotRecorded(Exception):
+    def __init__(self, method, endpoint):
+        self.status_code = HTTPStatus.NOT_FOUND
+        self.message = f'No recorded eSight answer for {method} {endpoint}'
+        super().__init__(self.message)
+
+    def __str__(self):
+        return self.message
+
+class CircuitOpen(Exception):
+    def __init__(self, endpoint):
+        self.status_code = HTTPStatus.SERVICE_UNAVAILABLE
+        self.message = f'{endpoint}: circuit open, eSight endpoint skipped until its cooldown is over'
+        super().__init__(self.message)
+
+    def __str__(self):
+        return self.message
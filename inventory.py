@@ -0,0 +1,131 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Description:
+# eSight inventory (interfaces, devices and their slots) cached on local disk
+# and refreshed in the background, reporting only what changed
+
+import time
+import logging
+import threading
+
+from devices import Device
+from state_files import load_json, save_json
+
+class Inventory_Cache:
+
+    def __init__(self, esight, path, slot_categories=(Device.ROUTER.value,), discovery_concurrency=8):
+        logging.basicConfig(format='[%(levelname)s] - %(asctime)s -> %(message)s', level=logging.INFO, datefmt='%d-%m-%Y %H:%M:%S')
+
+        # slots are only discovered for devices of slot_categories
+        self.esight = esight
+        self.path = path
+        self.slot_categories = slot_categories
+        self.discovery_concurrency = discovery_concurrency
+
+        self.interfaces = []
+        self.devices = []
+        self.slots = {}
+        self.refreshed_at = None
+
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def load(self):
+        cached = load_json(self.path, None)
+        if cached is None:
+            return False
+
+        self.interfaces = cached["interfaces"]
+        self.devices = cached["devices"]
+        self.slots = cached["slots"]
+        self.refreshed_at = cached["refreshed_at"]
+        logging.info(f"inventory: {len(self.interfaces)} interfaces, {len(self.devices)} devices loaded from {self.path}")
+
+        return True
+
+    def save(self):
+        save_json(self.path, {
+            "interfaces": self.interfaces,
+            "devices": self.devices,
+            "slots": self.slots,
+            "refreshed_at": self.refreshed_at
+        })
+
+    @staticmethod
+    def interfaces_by_key(interfaces):
+        return {f'{interface["nedn"]}|{interface["name"]}': interface for interface in interfaces}
+
+    @staticmethod
+    def slots_by_key(slots):
+        return {slot["serialnum"]: slot for device_slots in slots.values() for slot in device_slots}
+
+    @staticmethod
+    def diff_items(old, new):
+        return {
+            "added": [key for key in new if key not in old],
+            "removed": [key for key in old if key not in new],
+            "changed": [key for key in new if key in old and old[key].get("operstatus") != new[key].get("operstatus")]
+        }
+
+    def fetch_slots(self, devices):
+        nedns = [device["nedn"] for device in devices if device["necategory"] in self.slot_categories]
+        slots = self.esight.get_slots_lists(nedns, max_workers=self.discovery_concurrency)
+
+        # a device we cannot read now keeps the slots we knew about
+        for nedn in nedns:
+            if nedn not in slots and nedn in self.slots:
+                slots[nedn] = self.slots[nedn]
+
+        return slots
+
+    def refresh(self):
+        refresh_start = time.monotonic()
+
+        # streamed, only the fields the collector needs are kept
+        interfaces = list(self.esight.iter_interfaces())
+        devices = self.esight.get_network_devices_list()
+        slots = self.fetch_slots(devices)
+
+        diff = {
+            "interfaces": self.diff_items(self.interfaces_by_key(self.interfaces), self.interfaces_by_key(interfaces)),
+            "slots": self.diff_items(self.slots_by_key(self.slots), self.slots_by_key(slots))
+        }
+
+        self.interfaces = interfaces
+        self.devices = devices
+        self.slots = slots
+        self.refreshed_at = int(time.time()*1e3)
+        self.save()
+
+        logging.info(
+            f"inventory: refreshed in {time.monotonic() - refresh_start:.2f}s, "
+            + ", ".join(
+                f"{kind} +{len(changes['added'])} -{len(changes['removed'])} ~{len(changes['changed'])}"
+                for kind, changes in diff.items()
+            )
+        )
+
+        return diff
+
+    @staticmethod
+    def has_changes(diff):
+        return any(changes for kind in diff.values() for changes in kind.values())
+
+    def start_background(self, interval, on_change):
+        # on_change(diff) is called from the background thread after each
+        # refresh that found something added, removed or changed
+        def run():
+            while not self.stopped.wait(interval):
+                try:
+                    diff = self.refresh()
+                    if self.has_changes(diff):
+                        on_change(diff)
+                except Exception:
+                    logging.exception("inventory: background refresh failed")
+
+        self.thread = threading.Thread(target=run, name="inventory", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,91 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Description:
+# incremental parsing of large eSight answers, the items of one top level
+# array are yielded one at a time instead of decoding the whole body
+
+import json
+import codecs
+
+WHITESPACE = " \t\n\r"
+
+class Stream_Reader:
+
+    def __init__(self, chunks, compact_at=64*1024):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.position = 0
+        self.exhausted = False
+        self.compact_at = compact_at
+
+    def fill(self):
+        # drops what was already consumed and reads the next chunk
+        if self.position >= self.compact_at:
+            self.buffer = self.buffer[self.position:]
+            self.position = 0
+
+        for chunk in self.chunks:
+            text = self.decoder.decode(chunk)
+            if text:
+                self.buffer += text
+                return True
+
+        self.buffer += self.decoder.decode(b"", final=True)
+        self.exhausted = True
+        return False
+
+    def peek(self):
+        # next meaningful character, skipping whitespace and commas
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in WHITESPACE + ",":
+                self.position += 1
+
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+
+            if not self.fill():
+                raise ValueError("Unexpected end of JSON stream")
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' at position {self.position} of the JSON stream")
+        self.position += 1
+
+    def value(self, decoder=json.JSONDecoder()):
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.position)
+
+                # a number cut by the chunk boundary also decodes, wait for what follows it
+                if end < len(self.buffer) or self.exhausted:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.exhausted:
+                    raise
+
+            self.fill()
+
+def iter_array_items(chunks, key, meta=None):
+    # yields the items of the array under the top level key, the other top
+    # level members (code, description, ...) are stored in meta
+    if meta is None:
+        meta = {}
+
+    reader = Stream_Reader(chunks)
+    reader.expect("{")
+
+    while reader.peek() != "}":
+        name = reader.value()
+        reader.expect(":")
+
+        if name == key and reader.peek() == "[":
+            reader.expect("[")
+            while reader.peek() != "]":
+                yield reader.value()
+            reader.expect("]")
+        else:
+            meta[name] = reader.value()
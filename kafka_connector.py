@@ -7,21 +7,215 @@
 # Description:
 # kafka producer
 
-import json
+import time
 import logging
+import requests
+import threading
 from kafka import KafkaProducer
 
+from serializers import get_serializer
+
 class Kafka_Connector:
     producer = None
 
-    def __init__(self, address):
+    def __init__(self, address=None, linger_ms=50, batch_size=256*1024, compression_type=None, acks=1, max_in_flight=10000, serializer="json", discovery_url=None, spool=None, replay_rate=1000, rediscover_after=3, metrics=None):
         logging.basicConfig(format='[%(levelname)s] - %(asctime)s -> %(message)s', level=logging.INFO, datefmt='%d-%m-%Y %H:%M:%S')
-        self.producer = KafkaProducer(
-            bootstrap_servers=[address],
-            value_serializer=lambda x: json.dumps(x).encode("ascii")
-        )
 
-    def send_message(self, topic, msg):
-        logging.info(f"Sending message to {topic}")
+        # consumers tell the payload format apart by the content-type header
+        self.serializer = get_serializer(serializer)
+        self.headers = [("content-type", self.serializer.content_type.encode("ascii"))]
+
+        self.producer_config = {
+            "linger_ms": linger_ms,
+            "batch_size": batch_size,
+            "compression_type": compression_type,
+            "acks": acks
+        }
+
+        # address -> broker, when missing it is asked to discovery_url, which is
+        # also asked again after rediscover_after failed attempts to reach the broker
+        self.address = address
+        self.discovery_url = discovery_url
+        self.rediscover_after = rediscover_after
+        self.failures = 0
+
+        # spool -> Disk_Spool holding what could not be delivered, replayed in
+        # order (at most replay_rate messages per second) once Kafka is back
+        self.spool = spool
+        self.replay_rate = replay_rate
+        self.replay_lock = threading.Lock()
+
+        # sends are asynchronous, at most max_in_flight messages wait for
+        # their ack, send_message blocks beyond that (backpressure)
+        self.in_flight = threading.BoundedSemaphore(max_in_flight)
+        self.stats_lock = threading.Lock()
+        self.stats = {
+            "sent": 0,
+            "delivered": 0,
+            "failed": 0
+        }
+
+        # metrics -> Metrics_Registry, time until the broker acked, messages
+        # waiting for their ack or in the spool and failed deliveries
+        self.metrics = metrics
+        if self.metrics is not None:
+            self.metrics.describe("kafka_send_duration_seconds", "histogram", "Time from send until the broker acknowledged, per topic")
+            self.metrics.describe("kafka_messages_sent_total", "counter", "Messages handed to the producer, per topic")
+            self.metrics.describe("kafka_send_failures_total", "counter", "Messages Kafka could not take, per topic")
+            self.metrics.describe("kafka_messages_spooled_total", "counter", "Messages written to the disk spool, per topic")
+            self.metrics.add_gauge_function("kafka_queue_depth", "Messages waiting for Kafka, sent but not acked (in_flight) or spooled", self.queue_depth)
+
+        self.connect()
+
+    def resolve_address(self):
+        response = requests.get(url=self.discovery_url, timeout=5)
+        response.raise_for_status()
+        return response.text.strip()
+
+    def connect(self):
+        try:
+            if self.discovery_url and (self.address is None or self.failures >= self.rediscover_after):
+                self.address = self.resolve_address()
+                logging.info(f"Kafka: broker at {self.address}")
+
+            self.producer = KafkaProducer(
+                bootstrap_servers=[self.address],
+                **self.producer_config
+            )
+            self.failures = 0
+            return True
+
+        except Exception as e:
+            if self.spool is None:
+                raise
+
+            self.producer = None
+            self.failures += 1
+            logging.error(f"Kafka: could not connect ({self.failures} attempts), spooling messages - {e}")
+            return False
+
+    def count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def queue_depth(self):
+        with self.stats_lock:
+            in_flight = self.stats["sent"] - self.stats["delivered"] - self.stats["failed"]
+
+        depth = [({"queue": "in_flight"}, in_flight)]
+        if self.spool is not None:
+            depth.append(({"queue": "spool"}, self.spool.pending))
+        return depth
+
+    def on_delivery(self, metadata, sent_at=None):
+        self.in_flight.release()
+        self.count("delivered")
+
+        if self.metrics is not None and sent_at is not None:
+            self.metrics.observe("kafka_send_duration_seconds", time.monotonic() - sent_at, topic=metadata.topic)
+
+    def on_error(self, topic, key, value, exception):
+        self.in_flight.release()
+        self.count("failed")
+        logging.error(f"Could not deliver message to {topic}: {exception}")
+
+        if self.metrics is not None:
+            self.metrics.inc("kafka_send_failures_total", topic=topic)
+
+        self.spool_message(topic, key, value)
+
+    def spool_message(self, topic, key, value):
+        if self.spool is None:
+            return
+
+        self.spool.append(topic, key, value, self.headers)
+        if self.metrics is not None:
+            self.metrics.inc("kafka_messages_spooled_total", topic=topic)
+
+    def send_message(self, topic, msg, key=None):
+        logging.debug(f"Sending message to {topic}")
+
+        # messages with the same key go to the same partition
+        if isinstance(key, str):
+            key = key.encode("utf-8")
+
+        value = self.serializer.dumps(msg)
+
+        # while Kafka is down, or older messages still wait in the spool, new
+        # messages go to the spool too so the replay keeps them in order
+        if self.spool is not None and (self.producer is None or not self.spool.empty()):
+            self.spool_message(topic, key, value)
+            return
+
+        self.in_flight.acquire()
+        self.count("sent")
+        if self.metrics is not None:
+            self.metrics.inc("kafka_messages_sent_total", topic=topic)
+
+        sent_at = time.monotonic()
+        try:
+            future = self.producer.send(topic, value=value, key=key, headers=self.headers)
+        except Exception as e:
+            self.on_error(topic, key, value, e)
+            return
+
+        future.add_callback(lambda metadata: self.on_delivery(metadata, sent_at))
+        future.add_errback(lambda exception: self.on_error(topic, key, value, exception))
+
+    def send_batch(self, records):
+        # synchronous, returns once every record was acknowledged
+        batch_start = time.monotonic()
+
+        futures = [
+            self.producer.send(topic, value=value, key=key, headers=headers)
+            for topic, key, value, headers in records
+        ]
+        self.producer.flush()
+        for future in futures:
+            future.get(timeout=0)
+
+        # keep the replay under replay_rate messages per second
+        if self.replay_rate:
+            time.sleep(max(len(records) / self.replay_rate - (time.monotonic() - batch_start), 0))
+
+    def replay_spool(self):
+        if self.spool is None or self.spool.empty():
+            return
+
+        if not self.replay_lock.acquire(blocking=False):
+            return
+
+        try:
+            if self.producer is None and not self.connect():
+                return
+
+            replayed = self.spool.replay(self.send_batch)
+            logging.info(f"Kafka: replayed {replayed} spooled messages, {self.spool.pending} still spooled")
+
+        except Exception as e:
+            self.failures += 1
+            logging.error(f"Kafka: replay interrupted, {self.spool.pending} messages still spooled - {e}")
+
+            # maybe the broker moved, ask the discovery endpoint again next time
+            if self.discovery_url and self.failures >= self.rediscover_after:
+                self.close_producer()
+
+        finally:
+            self.replay_lock.release()
+
+    def close_producer(self):
+        if self.producer is not None:
+            try:
+                self.producer.close(timeout=5)
+            except Exception:
+                logging.exception("Kafka: could not close the producer")
+            self.producer = None
+
+    def flush(self, timeout=None):
+        if self.producer is not None:
+            self.producer.flush(timeout=timeout)
+
+        self.replay_spool()
 
-        self.producer.send(topic, value=msg)
+        with self.stats_lock:
+            logging.info(f"Kafka: {self.stats['sent']} sent, {self.stats['delivered']} delivered, {self.stats['failed']} failed")
@@ -1,259 +1,276 @@
-import json
-import time
 import logging
-import requests
 from datetime import datetime, timezone
 
 from config import config
-from devices import Device, Slot
+from catalog import Metric_Catalog
+from circuit_breaker import Breaker_Registry
+from collector import Metrics_Collector
+from inventory import Inventory_Cache
 from kafka_connector import Kafka_Connector
+from metrics import Metrics_Registry, Metrics_Server
+from provisioner import Task_Provisioner
+from rate_limiter import AIMD_Limiter, Esight_Limiter
+from readiness import Readiness_Tracker
+from records import interface_messages, publish_records, slot_messages
+from scheduler import Fixed_Rate_Scheduler
+from sinks import make_sink
+from spool import Disk_Spool
+from task_registry import Task_Registry
+from traffic_archive import Traffic_Recorder, Traffic_Replayer
+from watermarks import Watermark_Store
 from esight_connector import Esight_Connector
 
+def build_metrics_tasks(interfaces_tasks, slots_tasks, provisioned):
+    # forget the tasks eSight refused to create
+    for tasks in list(interfaces_tasks.values()) + list(slots_tasks.values()):
+        for task_id in list(tasks.keys()):
+            if task_id not in provisioned:
+                del tasks[task_id]
+
+    # flat views used to fetch each metric class in batches
+    interfaces_metrics_tasks = {task_id: task for tasks in interfaces_tasks.values() for task_id, task in tasks.items()}
+    slots_metrics_tasks = {task_id: task for tasks in slots_tasks.values() for task_id, task in tasks.items()}
+
+    return interfaces_metrics_tasks, slots_metrics_tasks
+
 if __name__ == '__main__':
     logging.basicConfig(format='[%(levelname)s] - %(asctime)s -> %(message)s', level=logging.INFO, datefmt='%d-%m-%Y %H:%M:%S')
     
     logging.info("Starting at " + datetime.now(timezone.utc).strftime("%d/%m/%Y, %H:%M:%S"))
 
-    esight = Esight_Connector(config.ESIGHT_LOCATION, config.ESIGHT_USERNAME, config.ESIGHT_PASSWORD)
-
-    interfaces_tasks = {}
-    slots_tasks = {}
-    tasks_ids = {}
-    
-    # --- INTERFACES ---
-    
-    # GET INTERFACES LIST
-    interfaces_list = esight.get_interfaces_list()
-
-    # CREATE INTERFACES' TASKS
-    for interface in interfaces_list:
-
-        if interface["operstatus"] != 3:
-            logging.info(interface["name"])
-
-            interfaces_tasks[interface['name']] = {}
-            
-            task_id = f"orwell-{interface['name']}-out"
-            if esight.create_task(
-                task_id,
-                interface["nedn"],
-                interface["name"],
-                'interface',
-                'ifXTrafficStat',
-                '[{"indicatorKey":"ifHCOutOctetsSpeed","symbol":"","thresholdValue":""}]',
-                4
-            ):
-                interfaces_tasks[interface['name']][task_id] = {
-                    "friendly_name": "sending_rate",
-                    "interface": interface
-                }
-                tasks_ids[task_id] = {
-                    "measUnitKey": "ifXTrafficStat",
-                    "measTypeKey": "ifHCOutOctetsSpeed"
-                }
-
-
-            task_id = f"orwell-{interface['name']}-in"                        
-            if esight.create_task(
-                task_id,
-                interface["nedn"],
-                interface["name"],
-                'interface',
-                'ifXTrafficStat',
-                '[{"indicatorKey":"ifHCInOctetsSpeed","symbol":"","thresholdValue":""}]',
-                4
-            ):
-                interfaces_tasks[interface['name']][task_id] = {
-                    "friendly_name": "receiving_rate",
-                    "interface": interface
-                }
-                tasks_ids[task_id] = {
-                    "measUnitKey": "ifXTrafficStat",
-                    "measTypeKey": "ifHCInOctetsSpeed"
-                }
-    
-    # --- SLOTS ---
-    network_devices_list = esight.get_network_devices_list()
-
-    # CREATE SLOTS' TASKS
-    for device in network_devices_list:
-        slots_tasks[device["nedn"]] = {}
-
-        if device["necategory"] == Device.ROUTER.value:
-            slots_list = esight.get_slots_list(device["nedn"])
-
-            for slot in slots_list:
-
-                if slot["operstatus"] in [3, 11, 13, 15, 16]:
-
-                    if slot['physicalclass'] == Slot.BOARD.value and "IPU" in slot["slotname"]:
-                        # CPU
-                        # get cpu usage
-                        logging.info(f'{slot["slotname"]}-cpu')
-                        task_id = f"orwell-{slot['serialnum']}-cpu"                   
-                        if esight.create_task(
-                            task_id,
-                            slot["nedn"],
-                            "Slot:"+slot["slotname"].replace(" ", "%20"),
-                            'slot',
-                            'CpuState',
-                            '[{"indicatorKey":"cpuUsage","symbol":"","thresholdValue":""}]',
-                            4
-                        ):
-                            slots_tasks[device["nedn"]][task_id] = {
-                                "friendly_name": "cpu_usage",
-                                "slot": slot
-                            }
-                            tasks_ids[task_id] = {
-                                "measUnitKey": "CpuState",
-                                "measTypeKey": "cpuUsage"
-                            }
-
-                        # get mem usage
-                        logging.info(f'{slot["slotname"]}-mem')
-                        task_id = f"orwell-{slot['serialnum']}-mem"                    
-                        if esight.create_task(
-                            task_id,
-                            slot["nedn"],
-                            "Slot:"+slot["slotname"].replace(" ", "%20"),
-                            'slot',
-                            'MemState',
-                            '[{"indicatorKey":"memUsage","symbol":"","thresholdValue":""}]',
-                            4
-                        ):
-                            slots_tasks[device["nedn"]][task_id] = {
-                                "friendly_name": "mem_usage",
-                                "slot": slot
-                            }
-                            tasks_ids[task_id] = {
-                                "measUnitKey": "MemState",
-                                "measTypeKey": "memUsage"
-                            }
-
-                    elif slot['physicalclass'] == Slot.FAN.value:
-
-                        # get fan speed
-                        logging.info(f'{slot["slotname"]}-fan')
-                        task_id = f"orwell-{slot['serialnum']}-fan"
-                        if esight.create_task(
-                            task_id,
-                            slot["nedn"],
-                            "Slot:"+slot["slotname"].replace(" ", "%20"),
-                            'slot',
-                            'hwEnvMainFan',
-                            '[{"indicatorKey":"hwEntityFanSpeed","symbol":"","thresholdValue":""}]',
-                            4
-                        ):
-                            slots_tasks[device["nedn"]][task_id] = {
-                                "friendly_name": "fan_speed",
-                                "slot": slot
-                            }
-                            tasks_ids[task_id] = {
-                                "measUnitKey": "hwEnvMainFan",
-                                "measTypeKey": "hwEntityFanSpeed"
-                            }
-                    
-                    elif slot['physicalclass'] == Slot.POWER.value:
-
-                        # get voltage
-                        logging.info(f'{slot["slotname"]}-volt')
-                        task_id = f"orwell-{slot['serialnum']}-volt"
-                        if esight.create_task(
-                            task_id,
-                            slot["nedn"],
-                            "Slot:"+slot["slotname"].replace(" ", "%20"),
-                            'slot',
-                            'hwEntityExtentMIB',
-                            '[{"indicatorKey":"hwEntityVoltage","symbol":"","thresholdValue":""}]',
-                            4
-                        ):
-                            slots_tasks[device["nedn"]][task_id] = {
-                                "friendly_name": "voltage",
-                                "slot": slot
-                            }
-                            tasks_ids[task_id] = {
-                                "measUnitKey": "hwEntityExtentMIB",
-                                "measTypeKey": "hwEntityVoltage"
-                            }
-
-    # we have to wait more or less 20 minutes so everything is up and running
+    # self-instrumentation, scraped from http://METRICS_HOST:METRICS_PORT/metrics
+    metrics_registry = Metrics_Registry()
+    if config.METRICS_PORT:
+        Metrics_Server(metrics_registry, config.METRICS_HOST, config.METRICS_PORT).start()
+
+    # record real eSight answers, or replay recorded ones with no network
+    recorder = Traffic_Recorder(config.ESIGHT_TRAFFIC_ARCHIVE) if config.ESIGHT_TRAFFIC_MODE == "record" else None
+    replayer = Traffic_Replayer(config.ESIGHT_TRAFFIC_ARCHIVE, config.ESIGHT_REPLAY_TIMING) if config.ESIGHT_TRAFFIC_MODE == "replay" else None
+
+    esight = Esight_Connector(
+        config.ESIGHT_LOCATION,
+        config.ESIGHT_USERNAME,
+        config.ESIGHT_PASSWORD,
+        pool_connections=config.ESIGHT_POOL_CONNECTIONS,
+        pool_maxsize=config.ESIGHT_POOL_MAXSIZE,
+        token_lifetime=config.ESIGHT_TOKEN_LIFETIME,
+        refresh_margin=config.ESIGHT_TOKEN_REFRESH_MARGIN,
+        batch_size=config.ESIGHT_BATCH_SIZE,
+        limiter=Esight_Limiter(
+            rate=config.ESIGHT_RATE_LIMIT,
+            burst=config.ESIGHT_RATE_BURST,
+            concurrency=AIMD_Limiter(
+                initial=config.ESIGHT_CONCURRENCY_INITIAL,
+                min_limit=config.ESIGHT_CONCURRENCY_MIN,
+                max_limit=config.ESIGHT_CONCURRENCY_MAX,
+                latency_target=config.ESIGHT_LATENCY_TARGET
+            )
+        ),
+        retries=config.ESIGHT_RETRIES,
+        backoff=config.ESIGHT_BACKOFF,
+        backoff_max=config.ESIGHT_BACKOFF_MAX,
+        breakers=Breaker_Registry(config.ESIGHT_BREAKER_THRESHOLD, config.ESIGHT_BREAKER_COOLDOWN),
+        metrics=metrics_registry,
+        recorder=recorder,
+        replayer=replayer
+    )
+
+    # which metrics exist for which interfaces and slots
+    catalog = Metric_Catalog.load(config.METRIC_CATALOG_PATH)
+
+    # --- INVENTORY ---
+    # loaded from the local cache when there is one, refreshed in the background
+    inventory = Inventory_Cache(
+        esight,
+        config.INVENTORY_PATH,
+        slot_categories=catalog.device_categories,
+        discovery_concurrency=config.ESIGHT_DISCOVERY_CONCURRENCY
+    )
+    if not inventory.load():
+        inventory.refresh()
+
+    provisioner = Task_Provisioner(esight, concurrency=config.PROVISIONING_CONCURRENCY)
+    registry = Task_Registry(config.TASK_REGISTRY_PATH)
+
+    # CREATE TASKS
+    # only what the registry does not know yet is created, and what it knows
+    # but is no longer wanted is deleted
+    task_specs, interfaces_tasks, slots_tasks = catalog.build_tasks(inventory.interfaces, inventory.devices, inventory.slots)
+    provisioned, created = registry.reconcile(provisioner, task_specs)
+    interfaces_metrics_tasks, slots_metrics_tasks = build_metrics_tasks(interfaces_tasks, slots_tasks, provisioned)
+
+    metrics_tasks = {**interfaces_metrics_tasks, **slots_metrics_tasks}
 
     start = int(datetime.now(timezone.utc).timestamp()*1e3)
 
-    time.sleep(20 * 60)
-
-    response = requests.get(url=config.KAFKA_LOCATION).text
-    kafka_producer = Kafka_Connector(response)
+    # tasks already running on eSight are producing data, no need to wait for them,
+    # new ones are polled as soon as eSight has something for them
+    readiness = Readiness_Tracker(
+        esight,
+        {task_id: metrics_tasks[task_id] for task_id in created if task_id in metrics_tasks},
+        start,
+        sample_size=config.READINESS_SAMPLE_SIZE,
+        max_wait=config.READINESS_MAX_WAIT
+    )
+    readiness.wait(config.READINESS_POLL_INTERVAL)
+
+    # the broker is asked to the discovery endpoint, while it cannot be reached
+    # messages are kept in the spool and replayed once it is back
+    kafka_producer = Kafka_Connector(
+        discovery_url=config.KAFKA_LOCATION,
+        spool=Disk_Spool(
+            config.KAFKA_SPOOL_DIR,
+            segment_bytes=config.KAFKA_SPOOL_SEGMENT_BYTES,
+            max_bytes=config.KAFKA_SPOOL_MAX_BYTES
+        ),
+        replay_rate=config.KAFKA_SPOOL_REPLAY_RATE,
+        rediscover_after=config.KAFKA_REDISCOVER_AFTER,
+        linger_ms=config.KAFKA_LINGER_MS,
+        batch_size=config.KAFKA_BATCH_SIZE,
+        compression_type=config.KAFKA_COMPRESSION or None,
+        acks=config.KAFKA_ACKS if config.KAFKA_ACKS == "all" else int(config.KAFKA_ACKS),
+        max_in_flight=config.KAFKA_MAX_IN_FLIGHT,
+        serializer=config.KAFKA_SERIALIZER,
+        metrics=metrics_registry
+    )
     
-    counter = 1
-    while True:
+    # where every task stopped last time, so a restart neither loses nor repeats windows
+    watermarks = Watermark_Store(config.WATERMARKS_PATH)
+    watermarks.forget([task_id for task_id in watermarks.watermarks if task_id not in metrics_tasks])
+
+    collector = Metrics_Collector(
+        esight,
+        concurrency=config.COLLECTOR_CONCURRENCY,
+        watermarks=watermarks,
+        max_window=config.COLLECTOR_MAX_WINDOW * 1000,
+        breakers=Breaker_Registry(config.ESIGHT_BREAKER_THRESHOLD, config.ESIGHT_BREAKER_COOLDOWN)
+    )
+
+    metrics_registry.describe("cycle_tasks_total", "counter", "Tasks handled by the polling cycles, per job and outcome")
+    metrics_registry.add_gauge_function(
+        "esight_breaker_state",
+        "Circuit breakers, 0 closed, 1 half open, 2 open",
+        lambda: collector.breakers.samples(kind="device") + (esight.breakers.samples(kind="endpoint") if esight.breakers else [])
+    )
+    metrics_registry.add_gauge_function(
+        "esight_concurrency",
+        "Adaptive eSight concurrency, current limit and requests in flight",
+        lambda: [({"stat": stat}, value) for stat, value in esight.limits().get("concurrency", {}).items()]
+    )
+
+    # each metric class keeps its own window, [previous boundary, current boundary],
+    # used by the tasks that have no watermark yet
+    windows_start = {
+        "interfaces": start,
+        "slots": start
+    }
+
+    # local copy of the messages, NDJSON files rotated and pruned by the sink
+    sink = make_sink(
+        config.OUTPUT_SINK,
+        config.OUTPUT_DIR,
+        max_bytes=config.OUTPUT_ROTATE_BYTES,
+        max_age=config.OUTPUT_ROTATE_SECONDS,
+        compression=config.OUTPUT_COMPRESSION or None,
+        retention=config.OUTPUT_RETENTION
+    )
+
+    # the tasks polled right now, swapped as a whole when the inventory changes
+    current = {
+        "tasks": (interfaces_tasks, interfaces_metrics_tasks, slots_tasks, slots_metrics_tasks)
+    }
+
+    def on_inventory_change(diff):
+        task_specs, interfaces_tasks, slots_tasks = catalog.build_tasks(inventory.interfaces, inventory.devices, inventory.slots)
+        provisioned, created = registry.reconcile(provisioner, task_specs)
+        interfaces_metrics_tasks, slots_metrics_tasks = build_metrics_tasks(interfaces_tasks, slots_tasks, provisioned)
+        metrics_tasks = {**interfaces_metrics_tasks, **slots_metrics_tasks}
+
+        readiness.track({task_id: metrics_tasks[task_id] for task_id in created if task_id in metrics_tasks})
+        watermarks.forget([task_id for task_id in list(watermarks.watermarks) if task_id not in metrics_tasks])
+
+        current["tasks"] = (interfaces_tasks, interfaces_metrics_tasks, slots_tasks, slots_metrics_tasks)
+
+    inventory.start_background(config.INVENTORY_REFRESH_INTERVAL, on_inventory_change)
+
+    def count_tasks(job, polled, metrics):
+        # failed and skipped (open breaker) tasks are asked again next cycle
+        metrics_registry.inc("cycle_tasks_total", len(metrics), job=job, outcome="collected")
+        metrics_registry.inc("cycle_tasks_total", len(polled) - len(metrics), job=job, outcome="missed")
+
+    def poll_interfaces(scheduled_at):
+        interfaces_tasks, interfaces_metrics_tasks, _, _ = current["tasks"]
 
         # GET METRICS
-        end = int(datetime.now(timezone.utc).timestamp()*1e3)
-        
-        # Interfaces
-        for interface_name, tasks in interfaces_tasks.items():
-            if len(tasks) > 0:
-                msg = {
-                    interface_name: {}
-                }
-
-                for task_id, task_info in tasks.items():
-
-                    metrics = esight.get_task_metrics(
-                        task_info["interface"]["nedn"], 
-                        task_info["interface"]["name"],
-                        'interface',
-                        tasks_ids[task_id]["measUnitKey"],
-                        tasks_ids[task_id]["measTypeKey"],
-                        start,
-                        end
-                    )
-                    msg[interface_name][task_info["friendly_name"]] = metrics
-
-                kafka_producer.send_message('esight_interface', msg)
-
-                with open(f'outputs/esight_interfaces_{counter}.txt', 'a+') as f:
-                    f.write(json.dumps(msg, indent=4))
-        
-        # Slots
-        for slot_nedn, tasks in slots_tasks.items():
-            if len(tasks) > 0:
-                msg = {}
-
-                for task_id, task_info in tasks.items():
-                    
-                    if task_info["slot"]["slotname"] not in msg.keys():
-                        msg[task_info["slot"]["slotname"]] = {}
-
-                    metrics = esight.get_task_metrics(
-                        task_info["slot"]["nedn"], 
-                        "Slot:"+task_info["slot"]["slotname"].replace(" ", "%20"),
-                        'slot',
-                        tasks_ids[task_id]["measUnitKey"],
-                        tasks_ids[task_id]["measTypeKey"],
-                        start,
-                        end
-                    )
-
-                    if task_info["friendly_name"] not in msg[task_info["slot"]["slotname"]].keys():
-                        msg[task_info["slot"]["slotname"]][task_info["friendly_name"]] = []
-
-                    msg[task_info["slot"]["slotname"]][task_info["friendly_name"]].append(metrics)                       
-
-                kafka_producer.send_message('esight_slot', msg)
-
-                with open(f'outputs/esight_slots_{counter}.txt', 'a+') as f:
-                    f.write(json.dumps(msg, indent=4))
-                    f.write('\n')
-
-        start = end
-        time.sleep(15*60)
-
-        counter += 1
-
-    # DELETE TASKS
-    # this step is optional, we do it to avoid having tasks running when they are not needed
-    for id in tasks_ids.keys():
-        esight.delete_task(id)
+        end = int(scheduled_at*1e3)
+        readiness.probe(end)
+        polled = {task_id: task for task_id, task in interfaces_metrics_tasks.items() if task_id not in readiness.pending}
+        metrics = collector.collect(polled, windows_start["interfaces"], end)
+        count_tasks("interfaces", polled, metrics)
+
+        if config.OUTPUT_MODE == "records":
+            for interface_name, tasks in interfaces_tasks.items():
+                for task_id, task in tasks.items():
+                    if task_id in metrics:
+                        publish_records(
+                            kafka_producer,
+                            config.KAFKA_INTERFACE_RECORDS_TOPIC,
+                            task.resource.nedn,
+                            interface_name,
+                            task.friendly_name,
+                            metrics[task_id]
+                        )
+
+            kafka_producer.flush()
+            windows_start["interfaces"] = end
+            return
+
+        for msg in interface_messages(interfaces_tasks, metrics):
+            kafka_producer.send_message('esight_interface', msg)
+
+            sink.write('esight_interfaces', msg)
+
+        kafka_producer.flush()
+        sink.flush()
+        windows_start["interfaces"] = end
+
+    def poll_slots(scheduled_at):
+        _, _, slots_tasks, slots_metrics_tasks = current["tasks"]
 
+        # GET METRICS
+        end = int(scheduled_at*1e3)
+        readiness.probe(end)
+        polled = {task_id: task for task_id, task in slots_metrics_tasks.items() if task_id not in readiness.pending}
+        metrics = collector.collect(polled, windows_start["slots"], end)
+        count_tasks("slots", polled, metrics)
+
+        if config.OUTPUT_MODE == "records":
+            for slot_nedn, tasks in slots_tasks.items():
+                for task_id, task in tasks.items():
+                    if task_id in metrics:
+                        publish_records(
+                            kafka_producer,
+                            config.KAFKA_SLOT_RECORDS_TOPIC,
+                            task.resource.nedn,
+                            task.resource.name,
+                            task.friendly_name,
+                            metrics[task_id]
+                        )
+
+            kafka_producer.flush()
+            windows_start["slots"] = end
+            return
+
+        for msg in slot_messages(slots_tasks, metrics):
+            kafka_producer.send_message('esight_slot', msg)
+
+            sink.write('esight_slots', msg)
+
+        kafka_producer.flush()
+        sink.flush()
+        windows_start["slots"] = end
+
+    scheduler = Fixed_Rate_Scheduler(jitter=config.SCHEDULER_JITTER, metrics=metrics_registry)
+    scheduler.add_job("interfaces", config.INTERFACES_INTERVAL, poll_interfaces)
+    scheduler.add_job("slots", config.SLOTS_INTERVAL, poll_slots)
+    scheduler.run_forever()
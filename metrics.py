@@ -0,0 +1,182 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Description:
+# self-instrumentation, counters, gauges and latency histograms exported
+# in the Prometheus text format on a local HTTP endpoint
+
+import math
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class Metrics_Registry:
+
+    # seconds, from a fast eSight answer up to a full polling cycle
+    default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.families = {}
+        self.gauge_functions = []
+
+    def describe(self, name, kind, help_text, buckets=None):
+        # kind -> "counter", "gauge" or "histogram"
+        with self.lock:
+            if name not in self.families:
+                self.families[name] = {
+                    "kind": kind,
+                    "help": help_text,
+                    "buckets": tuple(buckets or self.default_buckets),
+                    "samples": {}
+                }
+
+    def family(self, name, kind):
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = {
+                "kind": kind,
+                "help": "",
+                "buckets": self.default_buckets,
+                "samples": {}
+            }
+        return family
+
+    @staticmethod
+    def labels_key(labels):
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self.labels_key(labels)
+        with self.lock:
+            samples = self.family(name, "counter")["samples"]
+            samples[key] = samples.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = self.labels_key(labels)
+        with self.lock:
+            self.family(name, "gauge")["samples"][key] = value
+
+    def observe(self, name, value, **labels):
+        key = self.labels_key(labels)
+        with self.lock:
+            family = self.family(name, "histogram")
+            sample = family["samples"].get(key)
+            if sample is None:
+                # [count per bucket, sum, count]
+                sample = family["samples"][key] = [[0] * len(family["buckets"]), 0.0, 0]
+
+            for i, bound in enumerate(family["buckets"]):
+                if value <= bound:
+                    sample[0][i] += 1
+                    break
+            sample[1] += value
+            sample[2] += 1
+
+    def add_gauge_function(self, name, help_text, func):
+        # func() -> [(labels, value)], asked on every scrape, for state
+        # that already lives somewhere else (breakers, limits, spool)
+        self.gauge_functions.append((name, help_text, func))
+
+    @staticmethod
+    def format_labels(key, extra=()):
+        labels = list(key) + list(extra)
+        if not labels:
+            return ""
+
+        escaped = (
+            f'{label}="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+            for label, value in labels
+        )
+        return "{" + ",".join(escaped) + "}"
+
+    @staticmethod
+    def format_value(value):
+        if value == math.inf:
+            return "+Inf"
+        return repr(float(value)) if isinstance(value, float) else str(value)
+
+    def render(self):
+        lines = []
+
+        with self.lock:
+            for name, family in sorted(self.families.items()):
+                lines.append(f"# HELP {name} {family['help']}")
+                lines.append(f"# TYPE {name} {family['kind']}")
+
+                for key, sample in family["samples"].items():
+                    if family["kind"] != "histogram":
+                        lines.append(f"{name}{self.format_labels(key)} {self.format_value(sample)}")
+                        continue
+
+                    buckets, total, count = sample
+                    cumulative = 0
+                    for bound, bucket in zip(family["buckets"], buckets):
+                        cumulative += bucket
+                        lines.append(f"{name}_bucket{self.format_labels(key, [('le', self.format_value(bound))])} {cumulative}")
+                    lines.append(f"{name}_bucket{self.format_labels(key, [('le', '+Inf')])} {count}")
+                    lines.append(f"{name}_sum{self.format_labels(key)} {self.format_value(total)}")
+                    lines.append(f"{name}_count{self.format_labels(key)} {count}")
+
+        for name, help_text, func in self.gauge_functions:
+            try:
+                samples = func()
+            except Exception:
+                logging.exception(f"metrics: could not read {name}")
+                continue
+
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in samples:
+                lines.append(f"{name}{self.format_labels(self.labels_key(labels))} {self.format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+class Metrics_Server:
+
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self, registry, host="0.0.0.0", port=9108):
+        logging.basicConfig(format='[%(levelname)s] - %(asctime)s -> %(message)s', level=logging.INFO, datefmt='%d-%m-%Y %H:%M:%S')
+
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    def handler(self):
+        registry = self.registry
+        content_type = self.content_type
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # scrapes every few seconds would flood the log
+                pass
+
+        return Handler
+
+    def start(self):
+        self.server = ThreadingHTTPServer((self.host, self.port), self.handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True)
+        self.thread.start()
+        logging.info(f"metrics: serving on http://{self.host}:{self.server.server_address[1]}/metrics")
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
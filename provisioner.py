@@ -0,0 +1,82 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Description:
+# concurrent and idempotent creation of the eSight realtime performance tasks
+
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from esight_exceptions import TaskAlreadyExists
+
+class Task_Provisioner:
+
+    def __init__(self, esight, concurrency=8):
+        logging.basicConfig(format='[%(levelname)s] - %(asctime)s -> %(message)s', level=logging.INFO, datefmt='%d-%m-%Y %H:%M:%S')
+
+        self.esight = esight
+        self.concurrency = concurrency
+        self.last_summary = {}
+
+    def create(self, spec):
+        # spec -> keyword arguments of Esight_Connector.create_task
+        try:
+            if self.esight.create_task(**spec):
+                return "created"
+            return "failed"
+        except TaskAlreadyExists:
+            logging.info(f"provision: {spec['task_id']} already exists, reusing it")
+            return "reused"
+        except Exception:
+            logging.exception(f"provision: could not create {spec['task_id']}")
+            return "failed"
+
+    def provision(self, specs):
+        provisioning_start = time.monotonic()
+
+        summary = {
+            "created": 0,
+            "reused": 0,
+            "failed": 0
+        }
+        provisioned = set()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="provisioner") as executor:
+            futures = {executor.submit(self.create, spec): spec["task_id"] for spec in specs}
+
+            for future in as_completed(futures):
+                status = future.result()
+                summary[status] += 1
+
+                if status != "failed":
+                    provisioned.add(futures[future])
+
+        summary["elapsed"] = time.monotonic() - provisioning_start
+        self.last_summary = summary
+        logging.info(f"provision: {summary['created']} created, {summary['reused']} reused, {summary['failed']} failed in {summary['elapsed']:.2f}s")
+
+        return provisioned
+
+    def delete(self, task_id):
+        try:
+            self.esight.delete_task(task_id)
+            return True
+        except Exception:
+            logging.exception(f"deprovision: could not delete {task_id}")
+            return False
+
+    def deprovision(self, task_ids):
+        deprovisioning_start = time.monotonic()
+        deleted = set()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="provisioner") as executor:
+            futures = {executor.submit(self.delete, task_id): task_id for task_id in task_ids}
+
+            for future in as_completed(futures):
+                if future.result():
+                    deleted.add(futures[future])
+
+        logging.info(f"deprovision: {len(deleted)} deleted, {len(futures) - len(deleted)} failed in {time.monotonic() - deprovisioning_start:.2f}s")
+
+        return deleted
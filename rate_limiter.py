@@ -0,0 +1,139 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Description:
+# client-side load control for eSight: a token bucket per endpoint and an
+# AIMD concurrency limit following the latency and errors eSight shows
+
+import time
+import threading
+
+class Token_Bucket:
+
+    def __init__(self, rate, burst=None):
+        # rate -> requests per second, burst -> tokens that can pile up
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                self.refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+    def stats(self):
+        with self.lock:
+            self.refill()
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "tokens": self.tokens
+            }
+
+class AIMD_Limiter:
+
+    def __init__(self, initial=4, min_limit=1, max_limit=32, latency_target=2.0, backoff=0.5, smoothing=0.2):
+        # the limit grows by one request every limit successful requests and is
+        # cut by backoff when a request fails or takes longer than latency_target
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.smoothing = smoothing
+
+        self.in_flight = 0
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.decreased_at = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+        return time.monotonic()
+
+    def release(self, started_at, error=False):
+        latency = time.monotonic() - started_at
+
+        with self.condition:
+            self.in_flight -= 1
+            self.latency += self.smoothing * (latency - self.latency)
+            self.error_rate += self.smoothing * ((1.0 if error else 0.0) - self.error_rate)
+
+            if error or latency > self.latency_target:
+                # one cut per round trip, the requests already in flight saw the same overload
+                if started_at >= self.decreased_at:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self.decreased_at = time.monotonic()
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "latency": self.latency,
+                "error_rate": self.error_rate
+            }
+
+class Esight_Limiter:
+
+    def __init__(self, rate=20, burst=None, endpoint_rates=None, concurrency=None):
+        # rate -> default requests per second of each endpoint (0 disables it)
+        # endpoint_rates -> {endpoint: rate} overriding the default
+        # concurrency -> AIMD_Limiter shared by every endpoint
+        self.rate = rate
+        self.burst = burst
+        self.endpoint_rates = endpoint_rates or {}
+        self.concurrency = concurrency or AIMD_Limiter()
+
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, endpoint):
+        with self.lock:
+            if endpoint not in self.buckets:
+                rate = self.endpoint_rates.get(endpoint, self.rate)
+                self.buckets[endpoint] = Token_Bucket(rate, self.burst) if rate else None
+
+            return self.buckets[endpoint]
+
+    def acquire(self, endpoint):
+        bucket = self.bucket(endpoint)
+        if bucket is not None:
+            bucket.acquire()
+
+        return self.concurrency.acquire()
+
+    def release(self, started_at, error=False):
+        self.concurrency.release(started_at, error)
+
+    def stats(self):
+        with self.lock:
+            buckets = dict(self.buckets)
+
+        return {
+            "concurrency": self.concurrency.stats(),
+            "endpoints": {endpoint: bucket.stats() for endpoint, bucket in buckets.items() if bucket is not None}
+        }
@@ -0,0 +1,116 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Description:
+# detects when freshly created eSight tasks start producing data
+
+import time
+import random
+import logging
+import threading
+from datetime import datetime, timezone
+
+class Readiness_Tracker:
+
+    def __init__(self, esight, tasks, start, sample_size=20, max_wait=20*60):
+        logging.basicConfig(format='[%(levelname)s] - %(asctime)s -> %(message)s', level=logging.INFO, datefmt='%d-%m-%Y %H:%M:%S')
+
+        # tasks -> {task_id: Task}
+        self.esight = esight
+        self.pending = {}
+        self.deadlines = {}
+        self.starts = {}
+        self.sample_size = sample_size
+        self.max_wait = max_wait
+        self.lock = threading.Lock()
+
+        self.track(tasks, start)
+
+    def track(self, tasks, start=None):
+        # tasks created later (inventory changes) wait for their own data too,
+        # probed from when they were tracked so the range stays short
+        if start is None:
+            start = int(datetime.now(timezone.utc).timestamp()*1e3)
+
+        deadline = time.monotonic() + self.max_wait
+        with self.lock:
+            for task_id, task in tasks.items():
+                self.pending[task_id] = task
+                self.deadlines[task_id] = deadline
+                self.starts[task_id] = start
+
+    @staticmethod
+    def has_data(metrics):
+        return any(entry.get("indexValues") for entry in metrics or [])
+
+    def probe(self, end=None):
+        if not self.pending:
+            return set()
+
+        # several collection jobs may probe at the same time
+        with self.lock:
+            return self._probe(end)
+
+    def _probe(self, end):
+        if not self.pending:
+            return set()
+
+        # past the upper bound we stop waiting and poll them anyway
+        now = time.monotonic()
+        expired = {task_id for task_id in self.pending if self.deadlines[task_id] <= now}
+        if expired:
+            logging.info(f"readiness: max wait reached, polling {len(expired)} tasks without data")
+            self.promote(expired)
+
+        if not self.pending:
+            return expired
+
+        if end is None:
+            end = int(datetime.now(timezone.utc).timestamp()*1e3)
+
+        # a small sample tells us whether eSight already started collecting,
+        # only then it is worth asking for every pending task
+        sample = random.sample(list(self.pending), min(self.sample_size, len(self.pending)))
+        ready = self.check({task_id: self.pending[task_id] for task_id in sample}, end)
+
+        if ready and len(sample) < len(self.pending):
+            ready |= self.check({task_id: task for task_id, task in self.pending.items() if task_id not in ready}, end)
+
+        self.promote(ready)
+
+        logging.info(f"readiness: {len(ready)} tasks ready, {len(self.pending)} still pending")
+        return ready | expired
+
+    def promote(self, task_ids):
+        for task_id in task_ids:
+            del self.pending[task_id]
+            del self.deadlines[task_id]
+            del self.starts[task_id]
+
+    def check(self, tasks, end):
+        # tasks tracked together share their start, and their requests
+        tasks_by_start = {}
+        for task_id, task in tasks.items():
+            tasks_by_start.setdefault(self.starts[task_id], {})[task_id] = task
+
+        ready = set()
+        for start, start_tasks in tasks_by_start.items():
+            try:
+                metrics = self.esight.get_tasks_metrics(start_tasks, start, end)
+            except Exception:
+                logging.exception("readiness: probe failed")
+                continue
+
+            ready |= {task_id for task_id, task_metrics in metrics.items() if self.has_data(task_metrics)}
+
+        return ready
+
+    def wait(self, poll_interval=30):
+        # blocks until the first tasks have data (or the upper bound is reached)
+        ready = set()
+        while self.pending and not ready:
+            ready = self.probe()
+            if not ready and self.pending:
+                time.sleep(max(min(poll_interval, min(self.deadlines.values()) - time.monotonic()), 0))
+
+        return ready
@@ -0,0 +1,56 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Description:
+# shapes historyByIndexKeys answers for Kafka, nested messages per interface
+# or device, or one small record per sample
+
+def flatten_metrics(nedn, resource, indicator, metrics):
+    # metrics -> list of series, each one with its samples under "indexValues"
+    for entry in metrics or []:
+        for sample in entry.get("indexValues") or []:
+            yield {
+                "nedn": nedn,
+                "resource": resource,
+                "indicator": indicator,
+                "timestamp": sample.get("timestamp"),
+                "value": sample.get("value")
+            }
+
+def publish_records(kafka_producer, topic, nedn, resource, indicator, metrics):
+    # keyed by nedn, every sample of a device lands on the same partition (in order)
+    sent = 0
+    for record in flatten_metrics(nedn, resource, indicator, metrics):
+        kafka_producer.send_message(topic, record, key=nedn)
+        sent += 1
+
+    return sent
+
+def interface_messages(interfaces_tasks, metrics):
+    # one message per interface, {interface: {friendly_name: metrics}}
+    for interface_name, tasks in interfaces_tasks.items():
+        msg = {
+            interface_name: {}
+        }
+
+        for task_id, task in tasks.items():
+            if task_id in metrics:
+                msg[interface_name][task.friendly_name] = metrics[task_id]
+
+        if len(msg[interface_name]) > 0:
+            yield msg
+
+def slot_messages(slots_tasks, metrics):
+    # one message per device, {slot: {friendly_name: [metrics, ...]}}
+    for slot_nedn, tasks in slots_tasks.items():
+        msg = {}
+
+        for task_id, task in tasks.items():
+            # still warming up on eSight
+            if task_id not in metrics:
+                continue
+
+            msg.setdefault(task.resource.name, {}).setdefault(task.friendly_name, []).append(metrics[task_id])
+
+        if len(msg) > 0:
+            yield msg
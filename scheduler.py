@@ -0,0 +1,121 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Description:
+# fixed-rate scheduler, jobs fire on wall-clock boundaries of their interval
+# no matter how long the previous run took
+
+import time
+import random
+import logging
+import threading
+
+class Fixed_Rate_Scheduler:
+
+    def __init__(self, jitter=0, metrics=None):
+        logging.basicConfig(format='[%(levelname)s] - %(asctime)s -> %(message)s', level=logging.INFO, datefmt='%d-%m-%Y %H:%M:%S')
+
+        # metrics -> Metrics_Registry, duration, failures and overruns of each job
+        self.metrics = metrics
+        if self.metrics is not None:
+            self.metrics.describe("cycle_duration_seconds", "histogram", "Duration of each polling cycle, per job")
+            self.metrics.describe("cycle_failures_total", "counter", "Polling cycles that raised, per job")
+            self.metrics.describe("cycle_overruns_total", "counter", "Polling cycles skipped because the previous one was still running or late, per job")
+
+        # each run is delayed by a random amount up to jitter seconds, so jobs
+        # sharing a boundary do not hit eSight at the very same moment
+        self.jitter = jitter
+        self.jobs = []
+        self.stopped = threading.Event()
+
+    @staticmethod
+    def next_boundary(interval, now=None):
+        if now is None:
+            now = time.time()
+        return (int(now // interval) + 1) * interval
+
+    def add_job(self, name, interval, func):
+        # func receives the boundary (epoch seconds) the run belongs to
+        self.jobs.append({
+            "name": name,
+            "interval": interval,
+            "func": func,
+            "next_run": self.next_boundary(interval),
+            "thread": None,
+            "runs": 0,
+            "overruns": 0,
+            "last_duration": 0
+        })
+
+    def run_job(self, job, scheduled_at):
+        if self.jitter:
+            self.stopped.wait(random.uniform(0, min(self.jitter, job["interval"] / 2)))
+
+        job_start = time.monotonic()
+        try:
+            job["func"](scheduled_at)
+        except Exception:
+            logging.exception(f"scheduler: {job['name']} failed")
+            self.count("cycle_failures_total", job)
+
+        job["runs"] += 1
+        job["last_duration"] = time.monotonic() - job_start
+        if self.metrics is not None:
+            self.metrics.observe("cycle_duration_seconds", job["last_duration"], job=job["name"])
+        logging.info(f"scheduler: {job['name']} took {job['last_duration']:.2f}s")
+
+        if job["last_duration"] > job["interval"]:
+            logging.warning(f"scheduler: {job['name']} overran its {job['interval']}s interval ({job['last_duration']:.2f}s)")
+
+    def count(self, name, job, value=1):
+        if self.metrics is not None:
+            self.metrics.inc(name, value, job=job["name"])
+
+    def run_pending(self):
+        now = time.time()
+
+        for job in self.jobs:
+            if now < job["next_run"]:
+                continue
+
+            scheduled_at = job["next_run"]
+
+            # the boundaries we slept through are lost, the next run starts on the upcoming one
+            missed = int((now - scheduled_at) // job["interval"])
+            job["next_run"] = scheduled_at + (missed + 1) * job["interval"]
+
+            if job["thread"] is not None and job["thread"].is_alive():
+                job["overruns"] += 1
+                self.count("cycle_overruns_total", job)
+                logging.warning(f"scheduler: {job['name']} still running, skipping the run at {scheduled_at}")
+                continue
+
+            if missed:
+                job["overruns"] += missed
+                self.count("cycle_overruns_total", job, missed)
+                logging.warning(f"scheduler: {job['name']} missed {missed} runs")
+                scheduled_at += missed * job["interval"]
+
+            job["thread"] = threading.Thread(target=self.run_job, args=(job, scheduled_at), name=f"scheduler-{job['name']}", daemon=True)
+            job["thread"].start()
+
+    def run_forever(self):
+        while not self.stopped.is_set():
+            self.run_pending()
+
+            next_run = min(job["next_run"] for job in self.jobs)
+            self.stopped.wait(max(next_run - time.time(), 0))
+
+    def stop(self):
+        self.stopped.set()
+
+    def stats(self):
+        return {
+            job["name"]: {
+                "interval": job["interval"],
+                "runs": job["runs"],
+                "overruns": job["overruns"],
+                "last_duration": job["last_duration"]
+            }
+            for job in self.jobs
+        }
@@ -0,0 +1,49 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Description:
+# payload serializers for the messages sent to Kafka, each one tagged with
+# the content type consumers use to pick the matching decoder
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+class Serializer:
+
+    def __init__(self, name, content_type, dumps):
+        self.name = name
+        self.content_type = content_type
+        self.dumps = dumps
+
+    def __repr__(self):
+        return f"Serializer({self.name}, {self.content_type})"
+
+def compact_json(value):
+    return json.dumps(value, separators=(",", ":")).encode("ascii")
+
+SERIALIZERS = {
+    "json": Serializer("json", "application/json", compact_json)
+}
+
+if orjson is not None:
+    SERIALIZERS["orjson"] = Serializer("orjson", "application/json", orjson.dumps)
+
+if msgpack is not None:
+    SERIALIZERS["msgpack"] = Serializer("msgpack", "application/msgpack", lambda value: msgpack.packb(value, use_bin_type=True))
+
+def get_serializer(name):
+    if name not in SERIALIZERS:
+        if name in ("orjson", "msgpack"):
+            raise ValueError(f'Serializer "{name}" needs the {name} package installed')
+        raise ValueError(f'Unknown serializer "{name}", use one of {", ".join(SERIALIZERS)}')
+
+    return SERIALIZERS[name]
@@ -0,0 +1,140 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Description:
+# local copies of the messages sent to Kafka, as buffered append-only
+# NDJSON files with rotation, optional compression and retention
+
+import os
+import io
+import glob
+import gzip
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+class Null_Sink:
+
+    def write(self, stream, msg):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+class NDJSON_Sink:
+
+    extensions = {
+        None: ".ndjson",
+        "gzip": ".ndjson.gz",
+        "zstd": ".ndjson.zst"
+    }
+
+    def __init__(self, directory, max_bytes=64*1024*1024, max_age=60*60, compression=None, retention=48, buffer_size=1024*1024):
+        logging.basicConfig(format='[%(levelname)s] - %(asctime)s -> %(message)s', level=logging.INFO, datefmt='%d-%m-%Y %H:%M:%S')
+
+        if compression not in self.extensions:
+            raise ValueError(f'Unknown compression "{compression}", use gzip or zstd')
+        if compression == "zstd" and zstandard is None:
+            raise ValueError('zstd compression needs the zstandard package installed')
+
+        # a file is rotated once it holds max_bytes (before compression) or is
+        # max_age seconds old, only the newest retention files of each stream are kept
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compression = compression
+        self.retention = retention
+        self.buffer_size = buffer_size
+
+        self.lock = threading.Lock()
+        self.files = {}
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def open(self, stream):
+        opened_at = time.time()
+        timestamp = datetime.fromtimestamp(opened_at, timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        path = os.path.join(self.directory, f"{stream}-{timestamp}{self.extensions[self.compression]}")
+
+        # every layer is kept so they can be closed from the outside in
+        handles = [open(path, "ab", buffering=self.buffer_size)]
+        if self.compression == "gzip":
+            handles.append(gzip.GzipFile(fileobj=handles[-1], mode="ab"))
+        elif self.compression == "zstd":
+            handles.append(zstandard.ZstdCompressor().stream_writer(handles[-1], closefd=False))
+
+        if self.compression:
+            handles.append(io.BufferedWriter(handles[-1], buffer_size=self.buffer_size))
+
+        self.files[stream] = {
+            "path": path,
+            "file": handles[-1],
+            "handles": handles,
+            "opened_at": opened_at,
+            "bytes": 0
+        }
+        self.enforce_retention(stream)
+
+        return self.files[stream]
+
+    def close_file(self, stream):
+        current = self.files.pop(stream, None)
+        if current is None:
+            return
+
+        for handle in reversed(current["handles"]):
+            if not handle.closed:
+                handle.close()
+
+    def enforce_retention(self, stream):
+        paths = sorted(glob.glob(os.path.join(self.directory, f"{stream}-*{self.extensions[self.compression]}")))
+
+        for path in paths[:max(len(paths) - self.retention, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                logging.exception(f"sink: could not remove {path}")
+
+    def write(self, stream, msg):
+        line = json.dumps(msg, separators=(",", ":")).encode("ascii") + b"\n"
+
+        with self.lock:
+            current = self.files.get(stream)
+            if current is not None and (current["bytes"] >= self.max_bytes or time.time() - current["opened_at"] >= self.max_age):
+                self.close_file(stream)
+                current = None
+
+            if current is None:
+                current = self.open(stream)
+
+            current["file"].write(line)
+            current["bytes"] += len(line)
+
+    def flush(self):
+        with self.lock:
+            for current in self.files.values():
+                for handle in reversed(current["handles"]):
+                    handle.flush()
+
+    def close(self):
+        with self.lock:
+            for stream in list(self.files.keys()):
+                self.close_file(stream)
+
+def make_sink(kind, directory, max_bytes=64*1024*1024, max_age=60*60, compression=None, retention=48):
+    if kind == "none":
+        return Null_Sink()
+    if kind == "ndjson":
+        return NDJSON_Sink(directory, max_bytes=max_bytes, max_age=max_age, compression=compression, retention=retention)
+
+    raise ValueError(f'Unknown sink "{kind}", use ndjson or none')
@@ -0,0 +1,215 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Description:
+# disk-backed spool keeping the Kafka messages that could not be delivered,
+# append-only segment files replayed in order once the broker is back
+
+import os
+import glob
+import json
+import struct
+import logging
+import threading
+
+from state_files import load_json, save_json
+
+class Disk_Spool:
+
+    # topic length, key length (-1 for no key), value length, headers length
+    record_header = struct.Struct(">HiIH")
+
+    def __init__(self, directory, segment_bytes=16*1024*1024, max_bytes=1024*1024*1024):
+        logging.basicConfig(format='[%(levelname)s] - %(asctime)s -> %(message)s', level=logging.INFO, datefmt='%d-%m-%Y %H:%M:%S')
+
+        # when the spool would grow past max_bytes the oldest segments are dropped
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+
+        self.lock = threading.Lock()
+        self.writer = None
+        self.writer_path = None
+        self.stats = {
+            "spooled": 0,
+            "replayed": 0,
+            "dropped": 0
+        }
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        # how far into the oldest segment a previous replay already got
+        self.cursor_path = os.path.join(self.directory, "cursor.json")
+        self.cursor = load_json(self.cursor_path, {"segment": None, "offset": 0})
+        self.pending = self.count_pending()
+        if self.pending:
+            logging.info(f"spool: {self.pending} messages waiting from a previous run")
+
+    def segments(self):
+        return sorted(glob.glob(os.path.join(self.directory, "segment-*.spool")))
+
+    def count_pending(self):
+        pending = 0
+        for segment in self.segments():
+            with open(segment, "rb") as f:
+                if self.cursor["segment"] == os.path.basename(segment):
+                    f.seek(self.cursor["offset"])
+                pending += sum(1 for _ in self.read_records(f))
+
+        return pending
+
+    def empty(self):
+        return self.pending == 0
+
+    def seal(self):
+        # closes the segment being written, the next append opens a new one
+        if self.writer is not None:
+            self.writer.flush()
+            os.fsync(self.writer.fileno())
+            self.writer.close()
+            self.writer = None
+            self.writer_path = None
+
+    def open_segment(self):
+        segments = self.segments()
+        sequence = int(os.path.basename(segments[-1])[8:-6]) + 1 if segments else 0
+
+        self.writer_path = os.path.join(self.directory, f"segment-{sequence:012d}.spool")
+        self.writer = open(self.writer_path, "ab")
+
+    def drop_oldest(self, incoming):
+        segments = self.segments()
+        total = sum(os.path.getsize(path) for path in segments)
+
+        while segments and total + incoming > self.max_bytes:
+            oldest = segments.pop(0)
+
+            # never drop the segment we are writing to
+            if oldest == self.writer_path:
+                break
+
+            # records before the cursor were already replayed and counted then
+            with open(oldest, "rb") as f:
+                if self.cursor["segment"] == os.path.basename(oldest):
+                    f.seek(self.cursor["offset"])
+                    self.commit(None, 0)
+                dropped = sum(1 for _ in self.read_records(f))
+            total -= os.path.getsize(oldest)
+            os.remove(oldest)
+
+            self.stats["dropped"] += dropped
+            self.pending -= dropped
+            logging.warning(f"spool: full, dropped {dropped} messages from {os.path.basename(oldest)}")
+
+    def append(self, topic, key, value, headers=None):
+        topic_bytes = topic.encode("utf-8")
+        headers_bytes = json.dumps([[name, header.decode("latin-1")] for name, header in headers or []]).encode("utf-8")
+
+        record = self.record_header.pack(len(topic_bytes), -1 if key is None else len(key), len(value), len(headers_bytes))
+        record += topic_bytes + (key or b"") + value + headers_bytes
+
+        with self.lock:
+            self.drop_oldest(len(record))
+
+            if self.writer is None:
+                self.open_segment()
+
+            self.writer.write(record)
+            self.writer.flush()
+            self.stats["spooled"] += 1
+            self.pending += 1
+
+            if self.writer.tell() >= self.segment_bytes:
+                self.seal()
+
+    def read_records(self, f):
+        while True:
+            offset = f.tell()
+            header = f.read(self.record_header.size)
+            if len(header) < self.record_header.size:
+                return
+
+            topic_length, key_length, value_length, headers_length = self.record_header.unpack(header)
+            body = f.read(topic_length + max(key_length, 0) + value_length + headers_length)
+            if len(body) < topic_length + max(key_length, 0) + value_length + headers_length:
+                # torn write at the end of a segment
+                return
+
+            topic = body[:topic_length].decode("utf-8")
+            position = topic_length
+            key = None
+            if key_length >= 0:
+                key = body[position:position + key_length]
+                position += key_length
+            value = body[position:position + value_length]
+            position += value_length
+            headers = [(name, header.encode("latin-1")) for name, header in json.loads(body[position:])]
+
+            yield offset, f.tell(), (topic, key, value, headers)
+
+    def replay(self, send_batch, batch_size=500):
+        # send_batch(records) must return only once every record was delivered
+        # (raising otherwise), the cursor is committed after each batch
+        with self.lock:
+            self.seal()
+            segments = self.segments()
+
+        replayed = 0
+        for segment in segments:
+            name = os.path.basename(segment)
+            offset = self.cursor["offset"] if self.cursor["segment"] == name else 0
+
+            # drop_oldest may remove the segment while we read it (it does not
+            # wait for the replay), what is left of it is then no longer ours
+            try:
+                f = open(segment, "rb")
+            except FileNotFoundError:
+                continue
+
+            with f:
+                f.seek(offset)
+
+                batch = []
+                kept = True
+                for _, end, record in self.read_records(f):
+                    batch.append(record)
+
+                    if len(batch) >= batch_size:
+                        send_batch(batch)
+                        kept = self.replayed(len(batch), segment, end)
+                        if not kept:
+                            break
+                        replayed += len(batch)
+                        batch = []
+
+                if kept and batch:
+                    send_batch(batch)
+                    kept = self.replayed(len(batch), segment, f.tell())
+                    if kept:
+                        replayed += len(batch)
+
+            with self.lock:
+                if os.path.exists(segment):
+                    os.remove(segment)
+                    self.commit(None, 0)
+
+        return replayed
+
+    def replayed(self, count, segment, offset):
+        # False when the segment was dropped meanwhile, its records were counted there
+        with self.lock:
+            if not os.path.exists(segment):
+                return False
+
+            self.stats["replayed"] += count
+            self.pending -= count
+            self.commit(os.path.basename(segment), offset)
+            return True
+
+    def commit(self, segment, offset):
+        self.cursor = {"segment": segment, "offset": offset}
+        save_json(self.cursor_path, self.cursor)
+
+    def close(self):
+        with self.lock:
+            self.seal()
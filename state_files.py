@@ -0,0 +1,34 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Description:
+# helpers for the small JSON state files the collector keeps on local disk
+
+import os
+import json
+import logging
+
+def load_json(path, default):
+    if not os.path.exists(path):
+        return default
+
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        # a broken state file only costs us the state it had
+        logging.exception(f"state_files: could not read {path}, starting empty")
+        return default
+
+def save_json(path, data):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    # write aside and rename, a crash never leaves a half written file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
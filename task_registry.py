@@ -0,0 +1,66 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Description:
+# local record of the tasks already provisioned on eSight, so a restart
+# only creates what is missing and deletes what is no longer wanted
+
+import time
+import logging
+
+from state_files import load_json, save_json
+
+class Task_Registry:
+
+    def __init__(self, path):
+        logging.basicConfig(format='[%(levelname)s] - %(asctime)s -> %(message)s', level=logging.INFO, datefmt='%d-%m-%Y %H:%M:%S')
+
+        self.path = path
+        self.tasks = {}
+        self.load()
+
+    def load(self):
+        self.tasks = load_json(self.path, {})
+
+    def save(self):
+        save_json(self.path, self.tasks)
+
+    def is_running(self, spec):
+        entry = self.tasks.get(spec["task_id"])
+        return entry is not None and entry["spec"] == spec
+
+    def diff(self, specs):
+        # specs -> keyword arguments of Esight_Connector.create_task
+        desired = {spec["task_id"]: spec for spec in specs}
+
+        missing = [spec for spec in specs if not self.is_running(spec)]
+        running = [spec["task_id"] for spec in specs if self.is_running(spec)]
+
+        # tasks nobody wants anymore and tasks whose definition changed
+        stale = [
+            task_id for task_id, entry in self.tasks.items()
+            if task_id not in desired or entry["spec"] != desired[task_id]
+        ]
+
+        return missing, stale, running
+
+    def reconcile(self, provisioner, specs):
+        missing, stale, running = self.diff(specs)
+        logging.info(f"task_registry: {len(running)} running, {len(missing)} missing, {len(stale)} stale")
+
+        for task_id in provisioner.deprovision(stale):
+            del self.tasks[task_id]
+
+        created = provisioner.provision(missing)
+
+        now = int(time.time()*1e3)
+        for spec in missing:
+            if spec["task_id"] in created:
+                self.tasks[spec["task_id"]] = {
+                    "spec": spec,
+                    "created_at": now
+                }
+
+        self.save()
+
+        return set(running) | created, created
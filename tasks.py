@@ -0,0 +1,72 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Description:
+# compact in-memory model of the eSight tasks being polled, with the
+# historyByIndexKeys payload fragments computed once
+
+import sys
+import json
+
+class Resource:
+    # name -> what we call it (interface name, slot name)
+    # display -> what eSight calls it (subResourceName / displayValue)
+    # mo -> its "mos" entry, ready to be joined into a request
+    __slots__ = ("nedn", "name", "display", "resource_type", "mo")
+
+    def __init__(self, nedn, name, display, resource_type):
+        self.nedn = nedn
+        self.name = name
+        self.display = display
+        self.resource_type = resource_type
+        self.mo = json.dumps({"dn": nedn, "displayValue": display})
+
+    def __repr__(self):
+        return f"Resource({self.nedn}, {self.display})"
+
+class Task:
+    # index_key -> its "indexKeys" entry, shared by every task of the same indicator
+    __slots__ = ("task_id", "resource", "unit_key", "type_key", "friendly_name", "index_key")
+
+    def __init__(self, task_id, resource, unit_key, type_key, friendly_name, index_key):
+        self.task_id = task_id
+        self.resource = resource
+        self.unit_key = unit_key
+        self.type_key = type_key
+        self.friendly_name = friendly_name
+        self.index_key = index_key
+
+    def __repr__(self):
+        return f"Task({self.task_id})"
+
+class Task_Factory:
+
+    def __init__(self):
+        # the -in and -out tasks of an interface (or the cpu and mem of a board)
+        # point to the same Resource, indicator strings and fragments are shared
+        self.resources = {}
+        self.index_keys = {}
+
+    def resource(self, nedn, name, display, resource_type):
+        key = (nedn, display, resource_type)
+        if key not in self.resources:
+            self.resources[key] = Resource(sys.intern(nedn), name, display, sys.intern(resource_type))
+
+        return self.resources[key]
+
+    def index_key(self, resource_type, unit_key, type_key):
+        key = (resource_type, unit_key, type_key)
+        if key not in self.index_keys:
+            self.index_keys[key] = sys.intern(json.dumps({"resourceType": resource_type, "measUnitKey": unit_key, "measTypeKey": type_key}))
+
+        return self.index_keys[key]
+
+    def task(self, task_id, resource, unit_key, type_key, friendly_name):
+        return Task(
+            task_id,
+            resource,
+            sys.intern(unit_key),
+            sys.intern(type_key),
+            sys.intern(friendly_name),
+            self.index_key(resource.resource_type, unit_key, type_key)
+        )
@@ -0,0 +1,234 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Description:
+# record eSight request/response pairs to a compact archive and serve them
+# back without a network, to profile and compare changes on identical data
+
+import os
+import gzip
+import json
+import time
+import struct
+import logging
+import threading
+from collections import deque
+
+import requests
+
+from esight_exceptions import NotRecorded
+
+# bodies are matched without these, a replayed cycle asks for other windows
+VOLATILE_FIELDS = ("beginTime", "endTime")
+
+# their bodies (credentials, the openid) are not archived, the key carries no
+# body and the answer is stored as REDACTED_ANSWER
+REDACTED_ENDPOINTS = ("/sm/session",)
+REDACTED_ANSWER = b'{"code":0,"description":"Operation success.","data":"replayed"}'
+
+# recorded per series, so a replay can regroup them in other batches
+HISTORY_ENDPOINT = "/pm/historyByIndexKeys"
+
+def request_key(method, endpoint, data):
+    if endpoint in REDACTED_ENDPOINTS or not data:
+        return f"{method} {endpoint}"
+
+    try:
+        body = json.loads(data)
+    except ValueError:
+        return f"{method} {endpoint} {data}"
+
+    if isinstance(body, dict):
+        for field in VOLATILE_FIELDS:
+            body.pop(field, None)
+
+    return f"{method} {endpoint} " + json.dumps(body, sort_keys=True, separators=(",", ":"))
+
+def series_key(nedn, display, unit_key, type_key):
+    return f"POST {HISTORY_ENDPOINT} " + json.dumps([nedn, display, unit_key, type_key], separators=(",", ":"))
+
+def requested_series(data):
+    # historyByIndexKeys answers the cross product of "mos" and "indexKeys"
+    body = json.loads(data)
+    return [
+        (mo["dn"], mo["displayValue"], index_key["measUnitKey"], index_key["measTypeKey"])
+        for mo in json.loads(body["mos"])
+        for index_key in json.loads(body["indexKeys"])
+    ]
+
+class Traffic_Recorder:
+
+    # key length, response length, status, elapsed seconds
+    record_header = struct.Struct(">IIHf")
+
+    def __init__(self, path, compresslevel=6):
+        logging.basicConfig(format='[%(levelname)s] - %(asctime)s -> %(message)s', level=logging.INFO, datefmt='%d-%m-%Y %H:%M:%S')
+
+        # appended as a new gzip member, records of a previous run are kept
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.writer = gzip.open(path, "ab", compresslevel=compresslevel)
+        self.recorded = 0
+
+    def record(self, method, endpoint, data, response, elapsed):
+        # reading content here loads streamed bodies in memory, fine while recording
+        if method == "POST" and endpoint == HISTORY_ENDPOINT:
+            records = self.series_records(data, response)
+        elif endpoint in REDACTED_ENDPOINTS:
+            records = [(request_key(method, endpoint, data), REDACTED_ANSWER)]
+        else:
+            records = [(request_key(method, endpoint, data), response.content)]
+
+        with self.lock:
+            for key, content in records:
+                key = key.encode("utf-8")
+                self.writer.write(self.record_header.pack(len(key), len(content), response.status_code, elapsed))
+                self.writer.write(key)
+                self.writer.write(content)
+
+            # sync flush, a killed recorder still leaves a readable archive
+            self.writer.flush()
+            self.recorded += 1
+
+    @staticmethod
+    def series_records(data, response):
+        # one record per requested series: its entries (a JSON list) when eSight
+        # answered, or the whole answer (a JSON object) when it failed
+        series = requested_series(data)
+
+        try:
+            answer = json.loads(response.content)
+        except ValueError:
+            answer = None
+
+        if response.status_code != 200 or not isinstance(answer, dict) or answer.get("code") != 0:
+            return [(series_key(*key), response.content) for key in series]
+
+        entries = {key: [] for key in series}
+        for entry in answer.get("data") or []:
+            key = (entry.get("dn"), entry.get("displayValue"), entry.get("measUnitKey"), entry.get("measTypeKey"))
+
+            # a single series gets everything, as split_batch_metrics does
+            if len(series) == 1:
+                key = series[0]
+
+            if key in entries:
+                entries[key].append(entry)
+
+        return [(series_key(*key), json.dumps(key_entries).encode("utf-8")) for key, key_entries in entries.items()]
+
+    def close(self):
+        with self.lock:
+            self.writer.close()
+
+        logging.info(f"traffic: {self.recorded} eSight answers recorded to {self.path}")
+
+class Traffic_Replayer:
+
+    def __init__(self, path, timing="fast"):
+        logging.basicConfig(format='[%(levelname)s] - %(asctime)s -> %(message)s', level=logging.INFO, datefmt='%d-%m-%Y %H:%M:%S')
+
+        # timing -> "fast" answers at once, "recorded" takes as long as eSight took
+        if timing not in ("fast", "recorded"):
+            raise ValueError(f"Unknown replay timing {timing}, expected fast or recorded")
+
+        self.path = path
+        self.timing = timing
+        self.lock = threading.Lock()
+        self.answers = self.load(path)
+        self.stats = {
+            "replayed": 0,
+            "missed": 0
+        }
+
+        logging.info(f"traffic: {sum(len(answers) for answers in self.answers.values())} eSight answers loaded from {path}")
+
+    @classmethod
+    def read_records(cls, f):
+        header = Traffic_Recorder.record_header
+        while True:
+            try:
+                raw = f.read(header.size)
+                if len(raw) < header.size:
+                    return
+
+                key_length, content_length, status, elapsed = header.unpack(raw)
+                key = f.read(key_length).decode("utf-8")
+                content = f.read(content_length)
+            except EOFError:
+                # the recorder was killed between two flushes
+                return
+
+            if len(content) < content_length:
+                return
+
+            yield key, status, elapsed, content
+
+    @classmethod
+    def load(cls, path):
+        # same request asked several times -> its answers in recorded order
+        answers = {}
+        with gzip.open(path, "rb") as f:
+            for key, status, elapsed, content in cls.read_records(f):
+                answers.setdefault(key, deque()).append((status, elapsed, content))
+
+        return answers
+
+    def next_answer(self, key):
+        # the last answer keeps being served once the others were used
+        answers = self.answers.get(key)
+        if not answers:
+            return None
+
+        return answers.popleft() if len(answers) > 1 else answers[0]
+
+    def history_answer(self, data):
+        # rebuilt from the recorded series, whatever batches they were asked in
+        answers = [self.next_answer(series_key(*key)) for key in requested_series(data)]
+        if not answers or None in answers:
+            return None
+
+        elapsed = max(answer[1] for answer in answers)
+        entries = []
+        for status, _, content in answers:
+            series_entries = json.loads(content)
+
+            # a failed request fails the batch that asks for it again
+            if not isinstance(series_entries, list):
+                return status, elapsed, content
+
+            entries.extend(series_entries)
+
+        content = json.dumps({"code": 0, "description": "Operation success.", "data": entries}).encode("utf-8")
+        return 200, elapsed, content
+
+    def response(self, method, endpoint, data):
+        with self.lock:
+            if method == "POST" and endpoint == HISTORY_ENDPOINT:
+                answer = self.history_answer(data)
+            else:
+                answer = self.next_answer(request_key(method, endpoint, data))
+
+            if answer is None:
+                self.stats["missed"] += 1
+                raise NotRecorded(method, endpoint)
+
+            status, elapsed, content = answer
+            self.stats["replayed"] += 1
+
+        # a regrouped batch takes as long as its slowest recorded series
+        if self.timing == "recorded":
+            time.sleep(elapsed)
+
+        response = requests.Response()
+        response.status_code = status
+        response.reason = "Replayed"
+        response.url = endpoint
+        response.encoding = "utf-8"
+        response._content = content
+        response._content_consumed = True
+        return response
@@ -0,0 +1,49 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Description:
+# per-task timestamp of the last collected window, persisted so that
+# a restart resumes where the previous run stopped
+
+import logging
+import threading
+
+from state_files import load_json, save_json
+
+class Watermark_Store:
+
+    def __init__(self, path):
+        logging.basicConfig(format='[%(levelname)s] - %(asctime)s -> %(message)s', level=logging.INFO, datefmt='%d-%m-%Y %H:%M:%S')
+
+        self.path = path
+        self.lock = threading.Lock()
+        self.watermarks = load_json(self.path, {})
+
+    def get(self, task_id, default=None):
+        return self.watermarks.get(task_id, default)
+
+    def update(self, task_ids, timestamp):
+        with self.lock:
+            for task_id in task_ids:
+                # never move a watermark backwards
+                if self.watermarks.get(task_id, 0) < timestamp:
+                    self.watermarks[task_id] = timestamp
+
+            save_json(self.path, self.watermarks)
+
+    def forget(self, task_ids):
+        with self.lock:
+            for task_id in task_ids:
+                self.watermarks.pop(task_id, None)
+
+            save_json(self.path, self.watermarks)
+
+    @staticmethod
+    def split_window(start, end, max_window):
+        # [start, end] in milliseconds, cut in pieces of at most max_window
+        windows = []
+        while start < end:
+            windows.append((start, min(start + max_window, end)))
+            start += max_window
+
+        return windows